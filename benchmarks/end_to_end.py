@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""End-to-end throughput of the message handlers against a fake Telegram client.
+
+Feeds synthetic events through new_message_handler and edited_deleted_handler,
+wired up the same way main.run() does: the repository, media buffer, download
+scheduler, outbound dispatcher and text packer. Runs offline in a temporary
+DATA_ROOT; no Telegram credentials needed:
+
+    PYTHONPATH=src python benchmarks/end_to_end.py --messages 5000 --output run.json
+
+The phases run in order (ingest, edit, self_destruct, delete_dm, delete_channel).
+Each reports messages/sec and p50/p99 handler latency; the run reports the DB and
+media buffer size and peak RSS. Settings come from the environment as usual, e.g.
+DB_WRITE_BEHIND=true, so runs with different settings can be compared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import suppress
+from datetime import datetime, timezone
+
+from telethon import events
+from telethon.tl import types
+
+MY_ID = 1
+LOG_CHAT_ID = -1009999999999
+# message ids of DMs and basic groups come from one account-wide sequence, channel
+# ids restart per channel, so the two collide like they do on Telegram
+CHANNEL_FIRST_ID = 1
+
+
+def _set_env_defaults(data_root: str) -> None:
+    defaults = {
+        "API_ID": "1",
+        "API_HASH": "benchmark",
+        "LOG_CHAT_ID": str(LOG_CHAT_ID),
+        "DATA_ROOT": data_root,
+        "PROCESS_SELF_DESTRUCT_MEDIA": "true",
+        # the fake client has no flood limits; pacing would only measure the bucket
+        "LOG_SEND_RATE_PER_SEC": "1000000",
+        "LOG_SEND_BURST": "1000000",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    os.makedirs(os.path.join(os.environ["DATA_ROOT"], "db"), exist_ok=True)
+
+
+class FakeClient:
+    """The TelegramClient methods the handlers call, answered locally."""
+
+    parse_mode = None
+
+    def __init__(self, media_bytes: int, latency: float):
+        self.payload = os.urandom(media_bytes)
+        self.latency = latency
+        self.messages: dict[tuple[int, int], types.Message] = {}
+        self.sent_messages = 0
+        self.sent_files = 0
+        self.uploaded_bytes = 0
+
+    async def _network(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_me(self):
+        return types.User(id=MY_ID, first_name="Benchmark", is_self=True)
+
+    async def get_entity(self, peer):
+        await self._network()
+        peer_id = peer if isinstance(peer, int) else getattr(peer, "user_id", 0)
+        if peer_id > 0:
+            return types.User(id=peer_id, first_name=f"User{peer_id}", username=f"u{peer_id}")
+        return types.Channel(
+            id=abs(peer_id),
+            title=f"Chat {peer_id}",
+            photo=types.ChatPhotoEmpty(),
+            date=datetime.now(timezone.utc),
+        )
+
+    async def get_messages(self, chat_id, ids=None):
+        await self._network()
+        return self.messages.get((chat_id, ids))
+
+    async def download_media(self, media, path):
+        await self._network()
+        with open(path, "wb") as f:
+            f.write(self.payload)
+        return path
+
+    async def _upload_size(self, file) -> int:
+        if isinstance(file, str):
+            return os.path.getsize(file)
+        if isinstance(file, types.InputFile):
+            return 0
+        data = file.read() if hasattr(file, "read") else b""
+        if asyncio.iscoroutine(data):
+            data = await data
+        return len(data or b"")
+
+    async def upload_file(self, file, file_size=None, file_name=None):
+        await self._network()
+        self.uploaded_bytes += await self._upload_size(file)
+        return types.InputFile(
+            id=random.getrandbits(63), parts=1, name=file_name or "file", md5_checksum=""
+        )
+
+    async def send_file(self, entity, file, **kwargs):
+        await self._network()
+        for item in file if isinstance(file, list) else [file]:
+            self.uploaded_bytes += await self._upload_size(item)
+            self.sent_files += 1
+
+    async def send_message(self, entity, message="", **kwargs):
+        await self._network()
+        self.sent_messages += 1
+
+
+def _peer(chat_id: int):
+    if chat_id > 0:
+        return types.PeerUser(chat_id)
+    if chat_id > -1_000_000_000_000:
+        return types.PeerChat(-chat_id)
+    return types.PeerChannel(-chat_id - 1_000_000_000_000)
+
+
+def _message(client, chat_id, msg_id, text, media=None, grouped_id=None, edit_date=None):
+    message = types.Message(
+        id=msg_id,
+        peer_id=_peer(chat_id),
+        date=datetime.now(timezone.utc),
+        message=text,
+        from_id=None if chat_id > 0 else types.PeerUser(1000 + msg_id % 50),
+        media=media,
+        grouped_id=grouped_id,
+        edit_date=edit_date,
+    )
+    message._client = client
+    return message
+
+
+def _event(cls, client, message):
+    event = cls.Event(message)
+    event._client = client
+    if message.chat_id > 0:
+        # skips the sender refetch on private chats (ChatType USER vs BOT)
+        event._sender = types.User(id=message.chat_id, first_name="Peer")
+    return event
+
+
+class Workload:
+    """Synthetic events for every phase, generated up front from one seed."""
+
+    def __init__(self, client: FakeClient, args):
+        # media_codec imports telegram_logger, which reads DATA_ROOT on import
+        from media_codec import synthetic_media
+
+        rng = random.Random(args.seed)  # noqa: S311 - reproducible workload, not crypto
+        dms = [1000 + n for n in range(args.chats)]
+        groups = [-(2000 + n) for n in range(args.chats)]
+        channels = [-(1_000_000_000_000 + 3000 + n) for n in range(args.chats)]
+        account_id = 1
+        channel_ids = {chat_id: CHANNEL_FIRST_ID for chat_id in channels}
+
+        self.new: list = []
+        self.text_messages: list[types.Message] = []
+        self.self_destruct: list[types.Message] = []
+        stored: list[types.Message] = []
+
+        def next_id(chat_id: int) -> int:
+            nonlocal account_id
+            if chat_id in channel_ids:
+                channel_ids[chat_id] += 1
+                return channel_ids[chat_id]
+            account_id += 1
+            return account_id
+
+        while len(stored) < args.messages:
+            chat_id = rng.choice(rng.choices((dms, groups, channels), (4, 2, 4))[0])
+            kind = rng.random()
+            if kind < 0.6:
+                batch = [_message(client, chat_id, next_id(chat_id), f"text {rng.random()}")]
+                self.text_messages += batch
+            elif kind < 0.85:
+                batch = [_message(client, chat_id, next_id(chat_id), "", synthetic_media(rng))]
+            elif kind < 0.95:
+                grouped_id = rng.getrandbits(62)
+                batch = [
+                    _message(
+                        client,
+                        chat_id,
+                        next_id(chat_id),
+                        "album caption" if n == 0 else "",
+                        synthetic_media(rng),
+                        grouped_id,
+                    )
+                    for n in range(rng.randint(2, 5))
+                ]
+            else:
+                chat_id = rng.choice(dms)
+                media = synthetic_media(rng)
+                media.ttl_seconds = 30
+                batch = [_message(client, chat_id, next_id(chat_id), "", media)]
+                self.self_destruct += batch
+            stored += batch
+            for message in batch:
+                client.messages[(chat_id, message.id)] = message
+                self.new.append(_event(events.NewMessage, client, message))
+
+        now = datetime.now(timezone.utc)
+        self.edits = [
+            _event(
+                events.MessageEdited,
+                client,
+                _message(client, m.chat_id, m.id, m.message + " (edited)", edit_date=now),
+            )
+            for m in rng.sample(self.text_messages, int(len(self.text_messages) * args.edit_ratio))
+        ]
+
+        ttl_ids = [m.id for m in self.self_destruct]
+        self.read_contents = [
+            (types.UpdateReadMessagesContents(messages=ids, pts=0, pts_count=len(ids)), len(ids))
+            for ids in _batches(ttl_ids, rng, 1, 5)
+        ]
+
+        deleted = rng.sample(stored, int(len(stored) * args.delete_ratio))
+        dm_ids = [m.id for m in deleted if m.chat_id > -1_000_000_000_000]
+        by_channel: dict[int, list[int]] = {}
+        for m in deleted:
+            if m.chat_id <= -1_000_000_000_000:
+                by_channel.setdefault(m.chat_id, []).append(m.id)
+        # chat-less, like Telegram delivers deletions from DMs and basic groups
+        self.delete_dm = [
+            (events.MessageDeleted.Event(deleted_ids=ids, peer=None), len(ids))
+            for ids in _batches(dm_ids, rng, 1, args.max_delete_batch)
+        ]
+        self.delete_channel = [
+            (events.MessageDeleted.Event(deleted_ids=ids, peer=_peer(chat_id)), len(ids))
+            for chat_id, ids_in_chat in by_channel.items()
+            for ids in _batches(ids_in_chat, rng, 1, args.max_delete_batch)
+        ]
+        rng.shuffle(self.delete_channel)
+
+
+def _batches(ids: list[int], rng: random.Random, low: int, high: int) -> list[list[int]]:
+    batches = []
+    while ids:
+        size = rng.randint(low, high)
+        batches.append(ids[:size])
+        ids = ids[size:]
+    return batches
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def _run_phase(name: str, items: list, handle, rate: float, concurrency: int) -> dict:
+    """items are (event, message count) pairs; rate > 0 paces arrivals (events/sec)."""
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def _one(index: int, event) -> None:
+        nonlocal errors
+        if rate > 0:
+            await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+        async with semaphore:
+            begin = time.perf_counter()
+            try:
+                await handle(event)
+            except Exception:
+                errors += 1
+                logging.getLogger(__name__).exception("Handler failed in phase %s", name)
+            latencies.append(time.perf_counter() - begin)
+
+    await asyncio.gather(*(_one(index, event) for index, (event, _) in enumerate(items)))
+    wall = time.perf_counter() - started
+    messages = sum(count for _, count in items)
+    return {
+        "events": len(items),
+        "messages": messages,
+        "errors": errors,
+        "wall_secs": round(wall, 3),
+        "msgs_per_sec": round(messages / wall, 1) if wall else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            with suppress(OSError):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+async def _bench(args) -> dict:
+    from telegram_logger.database import MessageRepository, SeenMessageIndex
+    from telegram_logger.entity_cache import EntityCache
+    from telegram_logger.handlers.edited_deleted import edited_deleted_handler
+    from telegram_logger.handlers.new_message import new_message_handler
+    from telegram_logger.handlers.packing import DeletedTextPacker
+    from telegram_logger.outbound import OutboundDispatcher
+    from telegram_logger.settings import get_settings
+    from telegram_logger.storage.downloads import DownloadScheduler
+    from telegram_logger.storage.executor import StorageExecutor
+    from telegram_logger.storage.plaintext import PlaintextBufferStorage
+
+    settings = get_settings()
+    client = FakeClient(args.media_bytes, args.latency_ms / 1000)
+    db = MessageRepository(
+        settings.build_sqlite_url(),
+        write_behind=settings.db_write_behind,
+        batch_size=settings.db_write_batch_size,
+        flush_interval=settings.db_write_flush_interval_secs,
+        max_pending=settings.db_write_max_pending,
+        seen_index=(
+            SeenMessageIndex(
+                expected_messages=settings.seen_index_expected_messages,
+                recent_size=settings.seen_index_recent_size,
+                error_rate=settings.seen_index_error_rate,
+            )
+            if settings.seen_index_enabled
+            else None
+        ),
+        partition_by_day=settings.db_partition_by_day,
+    )
+    await db.init()
+    entity_cache = EntityCache(client, max_size=settings.entity_cache_max_size)
+    storage_io = StorageExecutor(max_workers=settings.storage_io_threads)
+    buffer_storage = PlaintextBufferStorage(
+        client=client,
+        media_dir=settings.media_dir,
+        max_buffer_size=settings.max_buffer_file_size,
+        entity_cache=entity_cache,
+        io=storage_io,
+        max_total_size=settings.max_media_buffer_size,
+        eviction_weights=settings.media_buffer_eviction_weights,
+        dedupe=settings.media_buffer_dedupe,
+    )
+    await buffer_storage.rebuild_index()
+    downloads = DownloadScheduler(
+        buffer_storage,
+        workers=settings.media_download_workers,
+        max_queue=max(settings.media_download_queue_limit, args.messages),
+    )
+    downloads.start()
+    outbound = OutboundDispatcher(
+        client,
+        rate=settings.log_send_rate_per_sec,
+        burst=settings.log_send_burst,
+        workers=settings.log_send_workers,
+    )
+    outbound.start()
+    text_packer = None
+    if settings.pack_deleted_text_messages:
+        text_packer = DeletedTextPacker(
+            outbound, settings.log_chat_id, window=settings.pack_deleted_text_window_secs
+        )
+
+    async def on_new(event):
+        await new_message_handler(
+            event, client, db, buffer_storage, settings, MY_ID, downloads=downloads
+        )
+
+    async def on_edited_deleted(event):
+        await edited_deleted_handler(
+            event,
+            client,
+            db,
+            buffer_storage,
+            None,
+            settings,
+            MY_ID,
+            entity_cache=entity_cache,
+            downloads=downloads,
+            outbound=outbound,
+            text_packer=text_packer,
+        )
+
+    async def on_edit(event):
+        # main registers both handlers for MessageEdited
+        await on_new(event)
+        await on_edited_deleted(event)
+
+    async def settle():
+        await db.flush()
+        while downloads.queued or downloads.stats()["in_flight"]:
+            await asyncio.sleep(0.01)
+        await outbound.wait_for_room(0)
+        while outbound.stats()["in_flight"]:
+            await asyncio.sleep(0.01)
+
+    generated = time.perf_counter()
+    workload = Workload(client, args)
+    generated = time.perf_counter() - generated
+
+    phases = [
+        ("ingest", [(event, 1) for event in workload.new], on_new),
+        ("edit", [(event, 1) for event in workload.edits], on_edit),
+        ("self_destruct", workload.read_contents, on_edited_deleted),
+        ("delete_dm", workload.delete_dm, on_edited_deleted),
+        ("delete_channel", workload.delete_channel, on_edited_deleted),
+    ]
+    results = {}
+    try:
+        for name, items, handle in phases:
+            results[name] = await _run_phase(name, items, handle, args.rate, args.concurrency)
+            settle_started = time.perf_counter()
+            await settle()
+            results[name]["settle_secs"] = round(time.perf_counter() - settle_started, 3)
+            logging.getLogger(__name__).info("Phase %s: %s", name, results[name])
+    finally:
+        await downloads.close()
+        if text_packer is not None:
+            await text_packer.close()
+        await outbound.close()
+        await db.close()
+        storage_io.shutdown()
+
+    data_root = str(settings.data_root)
+    return {
+        "config": {
+            "messages": args.messages,
+            "chats_per_kind": args.chats,
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "media_bytes": args.media_bytes,
+            "seed": args.seed,
+            "write_behind": settings.db_write_behind,
+            "partition_by_day": settings.db_partition_by_day,
+            "seen_index": settings.seen_index_enabled,
+        },
+        "workload_generation_secs": round(generated, 3),
+        "phases": results,
+        "log_chat": {
+            "messages": client.sent_messages,
+            "files": client.sent_files,
+            "uploaded_bytes": client.uploaded_bytes,
+        },
+        "db_bytes": _dir_size(os.path.join(data_root, "db")),
+        "media_buffer_bytes": _dir_size(str(settings.media_dir)),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "python": sys.version.split()[0],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end handler throughput benchmark")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages to ingest")
+    parser.add_argument("--chats", type=int, default=20, help="Chats per kind (DM/group/channel)")
+    parser.add_argument("--rate", type=float, default=0, help="Events/sec per phase, 0 = unpaced")
+    parser.add_argument("--concurrency", type=int, default=16, help="Events handled at once")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Fake API call latency")
+    parser.add_argument("--media-bytes", type=int, default=32 * 1024, help="Bytes per download")
+    parser.add_argument("--edit-ratio", type=float, default=0.1, help="Share of texts edited")
+    parser.add_argument("--delete-ratio", type=float, default=0.5, help="Share deleted")
+    parser.add_argument("--max-delete-batch", type=int, default=100, help="Ids per deletion event")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the workload")
+    parser.add_argument("--data-root", help="Keep data here instead of a temporary directory")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+    )
+    data_root = args.data_root or tempfile.mkdtemp(prefix="telegram-logger-bench-")
+    _set_env_defaults(data_root)
+    try:
+        report = asyncio.run(_bench(args))
+    finally:
+        if not args.data_root:
+            shutil.rmtree(data_root, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Compare the media codec against pickle: bytes per row and encode/decode time.
+
+Runs offline on synthetic Telethon media objects:
+
+    PYTHONPATH=src python benchmarks/media_codec.py --rows 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+# the database package loads settings on import; the benchmark never connects
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("LOG_CHAT_ID", "1")
+
+from telethon.tl import types  # noqa: E402
+
+from telegram_logger.database.media_codec import (  # noqa: E402
+    HAS_ZSTD,
+    decode_media,
+    encode_media,
+)
+
+
+def _date(rng: random.Random) -> datetime:
+    return datetime.fromtimestamp(1_700_000_000 + rng.randrange(10**7), tz=timezone.utc)
+
+
+def _photo(rng: random.Random):
+    return types.MessageMediaPhoto(
+        photo=types.Photo(
+            id=rng.getrandbits(63),
+            access_hash=rng.getrandbits(63),
+            file_reference=rng.randbytes(29),
+            date=_date(rng),
+            sizes=[
+                types.PhotoStrippedSize("i", rng.randbytes(rng.randrange(100, 700))),
+                types.PhotoSize("m", 320, 240, rng.randrange(10_000, 30_000)),
+                types.PhotoSize("x", 800, 600, rng.randrange(50_000, 90_000)),
+                types.PhotoSizeProgressive("y", 1280, 960, [10_000, 40_000, 120_000]),
+            ],
+            dc_id=rng.choice((1, 2, 4, 5)),
+        )
+    )
+
+
+def _document(rng: random.Random, mime: str, attributes: list, ttl: int | None = None):
+    return types.MessageMediaDocument(
+        document=types.Document(
+            id=rng.getrandbits(63),
+            access_hash=rng.getrandbits(63),
+            file_reference=rng.randbytes(29),
+            date=_date(rng),
+            mime_type=mime,
+            size=rng.randrange(10_000, 50_000_000),
+            dc_id=rng.choice((1, 2, 4, 5)),
+            attributes=attributes,
+            thumbs=[
+                types.PhotoStrippedSize("i", rng.randbytes(rng.randrange(100, 700))),
+                types.PhotoSize("m", 320, 180, rng.randrange(5_000, 20_000)),
+            ],
+        ),
+        ttl_seconds=ttl,
+    )
+
+
+def synthetic_media(rng: random.Random):
+    kind = rng.random()
+    if kind < 0.45:
+        return _photo(rng)
+    if kind < 0.7:
+        return _document(
+            rng,
+            "video/mp4",
+            [
+                types.DocumentAttributeVideo(
+                    duration=rng.randrange(1, 600), w=1280, h=720, supports_streaming=True
+                ),
+                types.DocumentAttributeFilename(f"video_{rng.randrange(10**6)}.mp4"),
+            ],
+        )
+    if kind < 0.85:
+        return _document(
+            rng,
+            "image/webp",
+            [
+                types.DocumentAttributeImageSize(w=512, h=512),
+                types.DocumentAttributeSticker(
+                    alt="🙂", stickerset=types.InputStickerSetEmpty()
+                ),
+            ],
+        )
+    if kind < 0.95:
+        return _document(
+            rng,
+            "audio/ogg",
+            [types.DocumentAttributeAudio(duration=rng.randrange(1, 120), voice=True)],
+        )
+    return _document(
+        rng,
+        "video/mp4",
+        [types.DocumentAttributeVideo(duration=10, w=384, h=384, round_message=True)],
+        ttl=rng.choice((None, 10, 60)),
+    )
+
+
+def _measure(name: str, encode, decode, media: list) -> dict:
+    started = time.perf_counter()
+    blobs = [encode(item) for item in media]
+    encode_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for blob in blobs:
+        decode(blob)
+    decode_secs = time.perf_counter() - started
+
+    total = sum(len(blob) for blob in blobs)
+    rows = len(media)
+    return {
+        "codec": name,
+        "rows": rows,
+        "bytes_total": total,
+        "bytes_per_row": round(total / rows, 1),
+        "encode_us_per_row": round(encode_secs / rows * 1e6, 2),
+        "decode_us_per_row": round(decode_secs / rows * 1e6, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the media codec against pickle")
+    parser.add_argument("--rows", type=int, default=10000, help="Number of synthetic media rows")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the media mix")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)  # noqa: S311 - reproducible test data, not crypto
+    media = [synthetic_media(rng) for _ in range(args.rows)]
+    results = [
+        _measure("pickle", pickle.dumps, pickle.loads, media),
+        _measure("tl", encode_media, decode_media, media),
+    ]
+    baseline = results[0]["bytes_total"]
+    for result in results:
+        result["size_ratio"] = round(result["bytes_total"] / baseline, 3)
+    json.dump({"zstd": HAS_ZSTD, "results": results}, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,11 +4,19 @@ from __future__ import annotations
 import argparse
 import base64
 import os
+import struct
 import sys
 from pathlib import Path
+from typing import BinaryIO, Iterator
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+# keep in sync with src/telegram_logger/storage/chunked_aead.py
+MAGIC = b"TLGENC"
+VERSION = 2
+TAG_SIZE = 16
+HEADER = struct.Struct(f">{len(MAGIC)}sBI7s")
+
 def _load_key(key_b64_arg: str | None) -> bytes:
     raw = key_b64_arg or os.getenv("TELEGRAM_DELETED_MEDIA_KEY_B64", "")
     if not raw:
@@ -21,12 +29,42 @@ def _load_key(key_b64_arg: str | None) -> bytes:
         raise ValueError("Key must decode to exactly 32 bytes (AES-256-GCM)")
     return key
 
-def _decrypt(enc_path: Path, key: bytes) -> bytes:
-    blob = enc_path.read_bytes()
-    if len(blob) < 13:
-        raise ValueError("Encrypted file is too short")
-    nonce, ct = blob[:12], blob[12:]
-    return AESGCM(key).decrypt(nonce, ct, None)
+def _read_exact(src: BinaryIO, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        part = src.read(size - len(buf))
+        if not part:
+            break
+        buf += part
+    return bytes(buf)
+
+def _decrypt(src: BinaryIO, key: bytes) -> Iterator[bytes]:
+    aes = AESGCM(key)
+    header = _read_exact(src, HEADER.size)
+    if len(header) < HEADER.size or not header.startswith(MAGIC):
+        # legacy single-shot format: nonce (12) | ciphertext+tag
+        blob = header + src.read()
+        if len(blob) < 13:
+            raise ValueError("Encrypted file is too short")
+        yield aes.decrypt(blob[:12], blob[12:], None)
+        return
+
+    _, version, chunk_size, prefix = HEADER.unpack(header)
+    if version != VERSION:
+        raise ValueError(f"Unsupported encrypted file version: {version}")
+    index = 0
+    segment = _read_exact(src, chunk_size + TAG_SIZE)
+    while True:
+        if len(segment) < TAG_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        following = _read_exact(src, chunk_size + TAG_SIZE) if len(segment) == chunk_size + TAG_SIZE else b""
+        last = not following
+        nonce = prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+        yield aes.decrypt(nonce, segment, header)
+        if last:
+            return
+        index += 1
+        segment = following
 
 def main() -> int:
     parser = argparse.ArgumentParser(
@@ -35,6 +73,7 @@ def main() -> int:
     parser.add_argument("--enc", required=True, help="Path to encrypted .enc file")
     parser.add_argument("--out", help="Output path for decrypted file (default: remove .enc suffix)")
     parser.add_argument("--key-b64", help="Base64 AES key (fallback: DELETED_MEDIA_KEY_B64 env var)")
+    parser.add_argument("--force", action="store_true", help="Overwrite the output file if it exists")
     args = parser.parse_args()
 
     enc_path = Path(args.enc)
@@ -58,15 +97,19 @@ def main() -> int:
         print(f"ERROR: Output exists: {out_path}", file=sys.stderr)
         return 2
 
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = out_path.with_name(out_path.name + ".part")
     try:
         key = _load_key(args.key_b64)
-        plaintext = _decrypt(enc_path, key)
+        with enc_path.open("rb") as src, part_path.open("wb") as dst:
+            for chunk in _decrypt(src, key):
+                dst.write(chunk)
+        part_path.replace(out_path)
     except Exception as exc:
+        part_path.unlink(missing_ok=True)
         print(f"ERROR: {exc}", file=sys.stderr)
         return 1
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_bytes(plaintext)
     print(f"Decrypted: {enc_path} -> {out_path}")
 
     return 0
@@ -2,7 +2,7 @@ import asyncio
 
 from telethon import TelegramClient
 
-from telegram_logger.main import run
+from telegram_logger.main import install_shutdown_handlers, run
 from telegram_logger.settings import get_settings
 
 settings = get_settings()
@@ -22,12 +22,21 @@ def ensure_directories() -> None:
 
 async def main():
     ensure_directories()
-    async with TelegramClient(
-        settings.session_file,
-        settings.api_id,
-        settings.api_hash.get_secret_value(),
-    ) as client:
-        await run(client)
+    shutdown = install_shutdown_handlers(asyncio.current_task())
+    try:
+        async with TelegramClient(
+            settings.session_file,
+            settings.api_id,
+            settings.api_hash.get_secret_value(),
+            # FloodWait must reach the outbound dispatcher, which pauses its token bucket
+            # and requeues the send; Telethon would otherwise sleep inside the worker
+            flood_sleep_threshold=0,
+        ) as client:
+            await run(client)
+    except asyncio.CancelledError:
+        # run() drained its queues on the way out; a signal is a clean exit
+        if not shutdown.is_set():
+            raise
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ from typing import List
 
 from .models import DbMessage, async_session, engine, register_models
 from .repository import MessageRepository
+from .seen_index import SeenMessageIndex
 
 __all__: List[str] = [
     "register_models",
@@ -9,4 +10,5 @@ __all__: List[str] = [
     "async_session",
     "DbMessage",
     "MessageRepository",
+    "SeenMessageIndex",
 ]
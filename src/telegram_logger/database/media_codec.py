@@ -0,0 +1,185 @@
+"""Compact encoding of Telethon media objects for DbMessage.media.
+
+A blob is a one-byte tag, the TL schema layer it was written with (uint16, little
+endian) and the object's TL serialization, the same bytes Telegram sends over the wire:
+
+    TAG_TL_LAYER       raw TL bytes
+    TAG_TL_LAYER_ZSTD  zstd-compressed TL bytes (only written when zstd is importable)
+
+TL bytes only decode with the schema that wrote them. A blob from another layer (e.g.
+written before a Telethon upgrade) is still tried; if it no longer parses, the media
+object is reported unavailable and the metadata columns remain. TAG_TL and TAG_TL_ZSTD
+are the same without the layer, as written by earlier versions.
+
+Most of a media object's TL bytes are thumbnail JPEG data, so zlib costs more time
+than it saves space and is not used.
+
+Rows written before this codec hold pickles. Pickle protocol 2+ starts with 0x80,
+which is not a valid tag, so decode_media() still reads them.
+"""
+
+from __future__ import annotations
+
+import logging
+import pickle
+import struct
+
+from telethon.extensions import BinaryReader
+from telethon.tl import types
+from telethon.tl.alltlobjects import LAYER
+
+logger = logging.getLogger(__name__)
+
+TAG_TL = 1
+TAG_TL_ZSTD = 2
+TAG_TL_LAYER = 3
+TAG_TL_LAYER_ZSTD = 4
+PICKLE_MARKER = 0x80
+
+_LAYER = struct.Struct("<H")
+_HEADER = bytes((TAG_TL_LAYER,)) + _LAYER.pack(LAYER)
+_HEADER_ZSTD = bytes((TAG_TL_LAYER_ZSTD,)) + _LAYER.pack(LAYER)
+
+# TL payloads below this rarely shrink enough to pay for decompression
+COMPRESS_MIN_SIZE = 256
+ZSTD_LEVEL = 3
+
+try:  # Python 3.14+
+    from compression import zstd as _zstd
+
+    def _zstd_compress(data: bytes) -> bytes:
+        return _zstd.compress(data, level=ZSTD_LEVEL)
+
+    def _zstd_decompress(data: bytes) -> bytes:
+        return _zstd.decompress(data)
+
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def _zstd_compress(data: bytes) -> bytes:
+            return _zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+        def _zstd_decompress(data: bytes) -> bytes:
+            return _zstd.ZstdDecompressor().decompress(data)
+
+    except ImportError:
+        _zstd = None
+
+HAS_ZSTD = _zstd is not None
+
+
+def encode_media(media) -> bytes | None:
+    if not media:
+        return None
+    data = bytes(media)
+    if HAS_ZSTD and len(data) >= COMPRESS_MIN_SIZE:
+        packed = _zstd_compress(data)
+        if len(packed) < len(data):
+            return _HEADER_ZSTD + packed
+    return _HEADER + data
+
+
+def decode_media(blob: bytes | None):
+    if not blob:
+        return None
+    tag = blob[0]
+    if tag == PICKLE_MARKER:
+        # legacy rows written by this app before the TL codec, read from our own DB
+        return pickle.loads(blob)  # noqa: S301
+    layer = None
+    if tag in (TAG_TL_LAYER, TAG_TL_LAYER_ZSTD):
+        (layer,) = _LAYER.unpack_from(blob, 1)
+        data = blob[1 + _LAYER.size :]
+    elif tag in (TAG_TL, TAG_TL_ZSTD):
+        data = blob[1:]
+    else:
+        raise ValueError(f"Unknown media blob tag: {tag}")
+    if tag in (TAG_TL_ZSTD, TAG_TL_LAYER_ZSTD):
+        if not HAS_ZSTD:
+            raise ValueError("Media blob is zstd-compressed but zstd is not available")
+        data = _zstd_decompress(data)
+    try:
+        with BinaryReader(data) as reader:
+            return reader.tgread_object()
+    except Exception as exc:
+        if layer == LAYER:
+            raise
+        # the schema changed under the blob; callers fall back to the metadata columns
+        logger.warning(
+            "Cannot decode media blob from TL layer %s with layer %s: %s",
+            layer if layer is not None else "unknown",
+            LAYER,
+            exc,
+        )
+        return None
+
+
+def is_legacy_blob(blob: bytes | None) -> bool:
+    return bool(blob) and blob[0] == PICKLE_MARKER
+
+
+def _photo_size(photo) -> int | None:
+    sizes = []
+    for size in photo.sizes:
+        if isinstance(size, types.PhotoSize):
+            sizes.append(size.size)
+        elif isinstance(size, types.PhotoSizeProgressive) and size.sizes:
+            sizes.append(max(size.sizes))
+    return max(sizes) if sizes else None
+
+
+def _document_kind(doc) -> str:
+    kind = "document"
+    for attr in doc.attributes:
+        if isinstance(attr, types.DocumentAttributeSticker):
+            return "sticker"
+        if isinstance(attr, types.DocumentAttributeAnimated):
+            return "animation"
+        if isinstance(attr, types.DocumentAttributeVideo):
+            kind = "video_note" if attr.round_message else "video"
+        elif isinstance(attr, types.DocumentAttributeAudio):
+            kind = "voice" if attr.voice else "audio"
+    return kind
+
+
+def media_columns(media) -> dict:
+    """Metadata columns stored next to the blob, so readers never have to decode it."""
+    columns = {
+        "media_kind": None,
+        "media_document_id": None,
+        "media_size": None,
+        "media_mime": None,
+        "media_filename": None,
+    }
+    if not media:
+        return columns
+
+    photo = media if isinstance(media, types.Photo) else getattr(media, "photo", None)
+    doc = media if isinstance(media, types.Document) else getattr(media, "document", None)
+    if isinstance(photo, types.Photo):
+        columns.update(
+            media_kind="photo",
+            media_document_id=photo.id,
+            media_size=_photo_size(photo),
+            media_mime="image/jpeg",
+        )
+    elif isinstance(doc, types.Document):
+        columns.update(
+            media_kind=_document_kind(doc),
+            media_document_id=doc.id,
+            media_size=doc.size,
+            media_mime=doc.mime_type,
+            media_filename=next(
+                (
+                    attr.file_name
+                    for attr in doc.attributes
+                    if isinstance(attr, types.DocumentAttributeFilename)
+                ),
+                None,
+            ),
+        )
+    else:
+        # geo, contact, poll, webpage, dice, ...: no file behind them
+        columns["media_kind"] = type(media).__name__.removeprefix("MessageMedia").lower()
+    return columns
@@ -1,25 +1,43 @@
 import logging
 from datetime import datetime, timedelta
-from typing import List, Union
+from typing import List, Sequence, Union
 
-from sqlalchemy import and_, delete, or_, select
+from sqlalchemy import (
+    Table,
+    bindparam,
+    column,
+    delete,
+    func,
+    insert,
+    literal,
+    null,
+    select,
+    update,
+)
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError, OperationalError
 from telethon.events import MessageDeleted, MessageEdited
 from telethon.tl.types import UpdateReadMessagesContents
 
+from telegram_logger.database.media_codec import PICKLE_MARKER
 from telegram_logger.database.models import DbMessage, async_session
 from telegram_logger.settings import get_settings
-from telegram_logger.tg_types import ChatType
+from telegram_logger.tg_types import ChatType, PeerKind
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+MESSAGES: Table = DbMessage.__table__
+# SQLITE_MAX_VARIABLE_NUMBER of builds before 3.32; newer ones allow 32766
+MAX_SQL_VARIABLES = 999
 
-async def message_exists(msg_id: int, chat_id: int) -> bool:
+
+async def message_exists(msg_id: int, chat_id: int, table: Table = MESSAGES) -> bool:
     async with async_session() as session:
-        query = select(DbMessage.id).where(
-            DbMessage.id == msg_id,
-            DbMessage.chat_id == chat_id,
+        query = select(table.c.id).where(
+            table.c.id == msg_id,
+            table.c.chat_id == chat_id,
         )
         exists = bool((await session.execute(query)).scalar())
         if exists:
@@ -40,8 +58,16 @@ async def save_message(
     self_destructing: bool,
     created_at: datetime,
     edited_at: datetime,
-) -> None:
-    message = DbMessage(
+    media_kind: str | None = None,
+    media_document_id: int | None = None,
+    media_size: int | None = None,
+    media_mime: str | None = None,
+    media_filename: str | None = None,
+    grouped_id: int | None = None,
+    peer_kind: int | None = None,
+    table: Table = MESSAGES,
+) -> bool:
+    query = insert(table).values(
         id=msg_id,
         from_id=from_id,
         chat_id=chat_id,
@@ -52,11 +78,18 @@ async def save_message(
         self_destructing=self_destructing,
         created_at=created_at,
         edited_at=edited_at,
+        media_kind=media_kind,
+        media_document_id=media_document_id,
+        media_size=media_size,
+        media_mime=media_mime,
+        media_filename=media_filename,
+        grouped_id=grouped_id,
+        peer_kind=peer_kind,
     )
 
     async with async_session() as session:
-        session.add(message)
         try:
+            await session.execute(query)
             await session.commit()
         except IntegrityError:
             # duplicate (id, chat_id) races can happen under concurrent update delivery
@@ -65,37 +98,153 @@ async def save_message(
         except OperationalError as exc:
             await session.rollback()
             logger.error("Failed to save message %s/%s: %s", chat_id, msg_id, exc)
+            return False
+        return True
 
 
-async def get_message_ids_by_event(
-    event: Union[MessageDeleted.Event, MessageEdited.Event, UpdateReadMessagesContents],
-    ids: List[int],
-) -> List[DbMessage]:
-    if hasattr(event, "chat_id") and event.chat_id:
-        where_clause = (DbMessage.chat_id == event.chat_id, DbMessage.id.in_(ids))
-    else:
-        where_clause = (DbMessage.chat_id.notlike("-100%"), DbMessage.id.in_(ids))
+async def save_messages(rows: Sequence[dict], table: Table = MESSAGES) -> int:
+    """Insert a batch of message rows in one transaction, skipping duplicates.
+
+    Errors such as "database is locked" propagate so the caller can retry the batch.
+    """
+    if not rows:
+        return 0
 
+    query = sqlite_insert(table).on_conflict_do_nothing(
+        index_elements=["id", "chat_id"]
+    )
+    async with async_session() as session:
+        try:
+            result = await session.execute(query, list(rows))
+            await session.commit()
+        except OperationalError:
+            await session.rollback()
+            raise
+
+        inserted = result.rowcount if result.rowcount and result.rowcount > 0 else 0
+        logger.debug("Saved message batch size=%s inserted=%s", len(rows), inserted)
+        return inserted
+
+
+async def count_messages(table: Table = MESSAGES) -> int:
+    async with async_session() as session:
+        return (await session.execute(select(func.count()).select_from(table))).scalar_one()
+
+
+async def iter_message_keys(batch_size: int = 10000, table: Table = MESSAGES):
+    """Yield (chat_id, id) pairs of all stored messages in batches."""
+    async with async_session() as session:
+        result = await session.stream(select(table.c.chat_id, table.c.id))
+        async for partition in result.partitions(batch_size):
+            yield partition
+
+
+async def get_media_batch(after_rowid: int, limit: int) -> list[tuple[int, bytes]]:
+    """Return (rowid, media) of up to limit rows still holding pickled media, in rowid order.
+
+    Migrated rows have media_kind set, which is checked first, so after a restart they
+    are skipped without reading their blobs.
+    """
+    rowid = column("rowid")
     async with async_session() as session:
         query = (
-            select(
-                DbMessage.id,
-                DbMessage.from_id,
-                DbMessage.chat_id,
-                DbMessage.type,
-                DbMessage.msg_text,
-                DbMessage.media,
-                DbMessage.noforwards,
-                DbMessage.self_destructing,
-                DbMessage.created_at,
+            select(rowid, DbMessage.media)
+            .where(
+                rowid > after_rowid,
+                DbMessage.media_kind.is_(None),
+                func.substr(DbMessage.media, 1, 1) == literal(bytes((PICKLE_MARKER,))),
             )
-            .where(*where_clause)
-            .order_by(DbMessage.edited_at.desc())
-            .distinct(DbMessage.chat_id, DbMessage.id)
-            .order_by(DbMessage.created_at.asc())
+            .order_by(rowid)
+            .limit(limit)
         )
+        return [tuple(row) for row in (await session.execute(query)).all()]
+
+
+async def update_media_rows(rows: Sequence[tuple[int, dict]]) -> None:
+    """Update media columns of (rowid, values) rows; all values dicts share their keys."""
+    if not rows:
+        return
+    names = list(rows[0][1])
+    query = (
+        update(DbMessage.__table__)
+        .where(column("rowid") == bindparam("_rowid"))
+        .values({name: bindparam(f"_{name}") for name in names})
+    )
+    params = [
+        {"_rowid": rowid, **{f"_{name}": values[name] for name in names}}
+        for rowid, values in rows
+    ]
+    async with async_session() as session:
+        await session.execute(query, params)
+        await session.commit()
+
+
+# chats whose message ids come from the account-wide sequence
+ACCOUNT_PEER_KINDS = (PeerKind.USER.value, PeerKind.CHAT.value)
+
 
-        rows = (await session.execute(query)).all()
+# MessageEventRow fields, in order; rows are built positionally from these columns
+EVENT_FIELDS = (
+    "id",
+    "chat_id",
+    "from_id",
+    "type",
+    "msg_text",
+    "has_media",
+    "noforwards",
+    "self_destructing",
+    "media_kind",
+    "media_document_id",
+    "media_size",
+    "media_mime",
+    "media_filename",
+    "grouped_id",
+)
+# rows are deduplicated by these, so every projection includes them
+KEY_FIELDS = frozenset(("id", "chat_id"))
+
+
+def _event_column(table: Table, name: str):
+    if name == "has_media":
+        # the blob itself is never read here, only whether there is one
+        return table.c.media.is_not(None).label("has_media")
+    return table.c[name]
+
+
+def _event_query(
+    chat_id: int | None,
+    ids: List[int],
+    table: Table = MESSAGES,
+    fields: Sequence[str] | None = None,
+):
+    wanted = KEY_FIELDS.union(fields) if fields is not None else EVENT_FIELDS
+    columns = [
+        _event_column(table, name) if name in wanted else null().label(name)
+        for name in EVENT_FIELDS
+    ]
+    if chat_id:
+        where_clause = (table.c.chat_id == chat_id, table.c.id.in_(ids))
+    else:
+        where_clause = (table.c.peer_kind.in_(ACCOUNT_PEER_KINDS), table.c.id.in_(ids))
+    return (
+        select(*columns)
+        .where(*where_clause)
+        .order_by(table.c.edited_at.desc())
+        .distinct(table.c.chat_id, table.c.id)
+        .order_by(table.c.created_at.asc())
+    )
+
+
+async def get_message_ids_by_event(
+    event: Union[MessageDeleted.Event, MessageEdited.Event, UpdateReadMessagesContents],
+    ids: List[int],
+    table: Table = MESSAGES,
+    fields: Sequence[str] | None = None,
+) -> List[tuple]:
+    """Rows with EVENT_FIELDS columns; fields not in the projection come back as None."""
+    chat_id = event.chat_id if hasattr(event, "chat_id") else None
+    async with async_session() as session:
+        rows = (await session.execute(_event_query(chat_id, ids, table, fields))).all()
         logger.debug(
             "Fetched messages for event=%s chat_id=%s ids_count=%s rows=%s",
             type(event).__name__,
@@ -106,34 +255,80 @@ async def get_message_ids_by_event(
         return rows
 
 
-async def delete_expired_messages_from_db(current_time: datetime) -> None:
-    # calculate the expiry times for different chat types
-    time_user = current_time - timedelta(days=settings.persist_time_in_days_user)
-    time_channel = current_time - timedelta(days=settings.persist_time_in_days_channel)
-    time_group = current_time - timedelta(days=settings.persist_time_in_days_group)
-    time_bot = current_time - timedelta(days=settings.persist_time_in_days_bot)
-    time_unknown = current_time - timedelta(days=settings.persist_time_in_days_group)
+async def explain_query_plan(query) -> list[str]:
+    sql = query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    async with async_session() as session:
+        conn = await session.connection()
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in result.all()]
+
 
-    where_clause = or_(
-        and_(DbMessage.type == ChatType.USER.value, DbMessage.created_at < time_user),
-        and_(
-            DbMessage.type == ChatType.CHANNEL.value,
-            DbMessage.created_at < time_channel,
-        ),
-        and_(DbMessage.type == ChatType.GROUP.value, DbMessage.created_at < time_group),
-        and_(DbMessage.type == ChatType.BOT.value, DbMessage.created_at < time_bot),
-        and_(
-            DbMessage.type == ChatType.UNKNOWN.value,
-            DbMessage.created_at < time_unknown,
+class QueryPlanError(Exception):
+    """A hot lookup's query plan scans the messages table."""
+
+
+async def check_query_plans(strict: bool = False) -> dict[str, list[str]]:
+    """EXPLAIN the hot lookups and warn about any that scan the messages table.
+
+    With strict=True a scan raises QueryPlanError instead; tests/test_query_plans.py
+    runs it that way so an index or query change that loses its index fails there.
+    """
+    queries = {
+        "event_lookup_chat": _event_query(-1001, [1, 2, 3]),
+        "event_lookup_account": _event_query(None, [1, 2, 3]),
+        "message_exists": select(DbMessage.id).where(
+            DbMessage.id == 1, DbMessage.chat_id == 1
         ),
+        "retention_chunk": _expired_chunk_query(ChatType.USER, datetime(2000, 1, 1), 1000),
+    }
+    plans = {}
+    regressions = []
+    for name, query in queries.items():
+        plan = await explain_query_plan(query)
+        plans[name] = plan
+        scans = [step for step in plan if step.startswith("SCAN messages")]
+        if scans:
+            regressions.append(f"{name}: {'; '.join(scans)}")
+            logger.warning("Query %s scans the messages table: %s", name, "; ".join(scans))
+        else:
+            logger.debug("Query plan %s: %s", name, "; ".join(plan))
+    if strict and regressions:
+        raise QueryPlanError("Queries scan the messages table: " + " | ".join(regressions))
+    return plans
+
+
+def retention_cutoffs(current_time: datetime) -> dict[ChatType, datetime]:
+    """Expiry time per chat type; messages created before it are deleted."""
+    days = {
+        ChatType.USER: settings.persist_time_in_days_user,
+        ChatType.CHANNEL: settings.persist_time_in_days_channel,
+        ChatType.GROUP: settings.persist_time_in_days_group,
+        ChatType.BOT: settings.persist_time_in_days_bot,
+        ChatType.UNKNOWN: settings.persist_time_in_days_group,
+    }
+    return {chat_type: current_time - timedelta(days=n) for chat_type, n in days.items()}
+
+
+def _expired_chunk_query(
+    chat_type: ChatType, cutoff: datetime, limit: int, table: Table = MESSAGES
+):
+    # stock SQLite builds have no DELETE ... LIMIT, so pick the rowids first
+    expired = (
+        select(column("rowid"))
+        .select_from(table)
+        .where(table.c.type == chat_type.value, table.c.created_at < cutoff)
+        .limit(limit)
     )
+    return delete(table).where(column("rowid").in_(expired))
+
 
+async def delete_expired_chunk(
+    chat_type: ChatType, cutoff: datetime, limit: int, table: Table = MESSAGES
+) -> int:
+    """Delete up to limit expired messages of one chat type in a short transaction."""
     async with async_session() as session:
-        result = await session.execute(delete(DbMessage).where(where_clause))
+        result = await session.execute(
+            _expired_chunk_query(chat_type, cutoff, limit, table)
+        )
         await session.commit()
-
-        rowcount = result.rowcount or 0
-        if rowcount > 0:
-            logger.info("Deleted expired messages from DB count=%s", rowcount)
-        else:
-            logger.debug("No expired messages to delete from DB")
+        return result.rowcount or 0
@@ -1,7 +1,17 @@
+import logging
 from datetime import datetime
 from typing import Annotated, TypeAlias
 
-from sqlalchemy import BigInteger, Index, Integer, PrimaryKeyConstraint, func
+from sqlalchemy import (
+    BigInteger,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    case,
+    func,
+    inspect,
+    update,
+)
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
     AsyncEngine,
@@ -11,7 +21,9 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, registry
 
 from telegram_logger.settings import get_settings
+from telegram_logger.tg_types import CHANNEL_ID_OFFSET, PeerKind
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
 Int16: TypeAlias = Annotated[int, 16]
@@ -36,18 +48,82 @@ class DbMessage(Base):
     noforwards: Mapped[bool] = mapped_column(default=False)
     self_destructing: Mapped[bool] = mapped_column(default=False)
 
+    # filled at ingest so readers can decide without decoding the media blob
+    media_kind: Mapped[str | None] = mapped_column(nullable=True)
+    media_document_id: Mapped[Int64 | None] = mapped_column(nullable=True)
+    media_size: Mapped[Int64 | None] = mapped_column(nullable=True)
+    media_mime: Mapped[str | None] = mapped_column(nullable=True)
+    media_filename: Mapped[str | None] = mapped_column(nullable=True)
+    grouped_id: Mapped[Int64 | None] = mapped_column(nullable=True)
+    # PeerKind of chat_id, so chat-less deletions (DMs, basic groups) can use an index
+    peer_kind: Mapped[int | None] = mapped_column(nullable=True)
+
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     edited_at: Mapped[datetime] = mapped_column(nullable=True)
 
     __table_args__ = (
         PrimaryKeyConstraint("id", "chat_id"),
         Index("messages_created_index", created_at.desc()),
+        # retention deletes per chat type, oldest first
+        Index("messages_type_created_index", type, created_at),
+        Index("messages_peer_kind_id_index", peer_kind, id),
+    )
+
+
+def _add_missing_columns(conn, tables=None) -> None:
+    """create_all() leaves existing tables alone; add columns introduced later."""
+    inspector = inspect(conn)
+    for table in tables if tables is not None else Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(
+                f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            )
+            logger.info("Added column %s.%s", table.name, column.name)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+# indexes no query reads any more; dropped from existing databases, partitions included
+OBSOLETE_INDEX_SUFFIXES = ("media_document_index",)
+
+
+def _drop_obsolete_indexes(conn) -> None:
+    names = conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name GLOB 'messages_*'"
+    ).scalars()
+    for name in list(names):
+        if name.endswith(OBSOLETE_INDEX_SUFFIXES):
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+            logger.info("Dropped unused index %s", name)
+
+
+def _backfill_peer_kind(conn) -> None:
+    peer_kind = case(
+        (DbMessage.chat_id >= 0, PeerKind.USER.value),
+        (DbMessage.chat_id > -CHANNEL_ID_OFFSET, PeerKind.CHAT.value),
+        else_=PeerKind.CHANNEL.value,
+    )
+    result = conn.execute(
+        update(DbMessage.__table__)
+        .where(DbMessage.peer_kind.is_(None))
+        .values(peer_kind=peer_kind)
     )
+    if result.rowcount:
+        logger.info("Backfilled messages.peer_kind rows=%s", result.rowcount)
 
 
 async def register_models() -> None:
     async with engine.begin() as conn:
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_drop_obsolete_indexes)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_backfill_peer_kind)
 
 
 engine: AsyncEngine = create_async_engine(url=settings.build_sqlite_url())
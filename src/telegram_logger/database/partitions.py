@@ -0,0 +1,116 @@
+"""Per-day message partitions.
+
+With partitioning enabled, new rows go to messages_YYYYMMDD tables, picked by the
+row's created_at (UTC) and shaped like messages, indexes included. Once every row
+of a day has expired the whole table is dropped instead of deleted row by row, and
+SQLite reuses its pages for later partitions. The plain messages table keeps rows
+written before partitioning was enabled and is read as the oldest partition.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from datetime import date, datetime, time, timezone
+
+from sqlalchemy import MetaData, Table, func, select
+
+from telegram_logger.database.models import DbMessage, _add_missing_columns, engine
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "messages_"
+_PARTITION_NAME = re.compile(r"^messages_(\d{8})$")
+_metadata = MetaData()
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> date | None:
+    match = _PARTITION_NAME.match(name)
+    return datetime.strptime(match[1], "%Y%m%d").date() if match else None
+
+
+def day_of(created_at: datetime) -> date:
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time(), tzinfo=timezone.utc)
+
+
+def _partition_table(day: date) -> Table:
+    name = partition_name(day)
+    table = _metadata.tables.get(name)
+    if table is None:
+        table = DbMessage.__table__.to_metadata(_metadata, name=name)
+        # index names are global in SQLite
+        for index in table.indexes:
+            index.name = f"{name}_{index.name.removeprefix(PARTITION_PREFIX)}"
+    return table
+
+
+class MessagePartitions:
+    """Tracks the day partitions that exist in the database."""
+
+    def __init__(self):
+        self._tables: dict[date, Table] = {}
+        self._create_lock = asyncio.Lock()
+        self.dropped = 0
+
+    async def load(self) -> None:
+        async with engine.begin() as conn:
+            result = await conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+                (f"{PARTITION_PREFIX}[0-9]*",),
+            )
+            days = [day for day in map(partition_day, result.scalars()) if day is not None]
+            tables = {day: _partition_table(day) for day in days}
+            await conn.run_sync(_add_missing_columns, list(tables.values()))
+        self._tables = tables
+        logger.info("Loaded message partitions count=%s", len(tables))
+
+    def tables(self) -> list[Table]:
+        """Partitions newest first, then the unpartitioned messages table."""
+        days = sorted(self._tables, reverse=True)
+        return [self._tables[day] for day in days] + [DbMessage.__table__]
+
+    def days(self) -> list[date]:
+        return sorted(self._tables)
+
+    async def table_for(self, created_at: datetime) -> Table:
+        day = day_of(created_at)
+        table = self._tables.get(day)
+        if table is not None:
+            return table
+        async with self._create_lock:
+            if day not in self._tables:
+                table = _partition_table(day)
+                async with engine.begin() as conn:
+                    await conn.run_sync(table.create, checkfirst=True)
+                self._tables[day] = table
+                logger.info("Created message partition %s", table.name)
+            return self._tables[day]
+
+    async def drop(self, day: date) -> int:
+        """Drop the day's table; returns how many rows it held."""
+        table = self._tables.pop(day)
+        async with engine.begin() as conn:
+            rows = (await conn.execute(select(func.count()).select_from(table))).scalar_one()
+            await conn.run_sync(table.drop, checkfirst=True)
+        self.dropped += 1
+        logger.info("Dropped expired message partition %s rows=%s", table.name, rows)
+        return rows
+
+    def stats(self) -> dict:
+        days = self.days()
+        return {
+            "count": len(days),
+            "oldest": days[0].isoformat() if days else None,
+            "dropped": self.dropped,
+        }
@@ -1,84 +1,578 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
+from contextlib import suppress
 from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
 from typing import Sequence
 
+from sqlalchemy import Table
+from sqlalchemy.exc import OperationalError
+
+from telegram_logger.database.media_codec import (
+    decode_media,
+    encode_media,
+    is_legacy_blob,
+    media_columns,
+)
 from telegram_logger.database.methods import (
-    delete_expired_messages_from_db,
+    ACCOUNT_PEER_KINDS,
+    EVENT_FIELDS,
+    KEY_FIELDS,
+    MAX_SQL_VARIABLES,
+    MESSAGES,
+    check_query_plans,
+    count_messages,
+    delete_expired_chunk,
+    get_media_batch,
     get_message_ids_by_event,
+    iter_message_keys,
     message_exists,
+    retention_cutoffs,
     save_message,
+    save_messages,
+    update_media_rows,
 )
 from telegram_logger.database.models import register_models
+from telegram_logger.database.partitions import MessagePartitions, day_start, partition_day
+from telegram_logger.database.seen_index import SeenMessageIndex
+from telegram_logger.health.metrics import MESSAGES_SAVED
+from telegram_logger.tg_types import ChatType, peer_kind_for
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(slots=True)
 class MessageEventRow:
+    """A message as seen by the edit/deletion handlers; field order is EVENT_FIELDS.
+
+    Fields left out of a lookup's projection are None. The media blob is not part
+    of it; deleted media is sent from the media buffer, not from the stored object.
+    """
+
     id: int
-    from_id: int
     chat_id: int
-    type: int
-    msg_text: str | None
-    media: bytes | None
-    noforwards: bool
-    self_destructing: bool
+    from_id: int | None = None
+    type: int | None = None
+    msg_text: str | None = None
+    has_media: bool | None = None
+    noforwards: bool | None = None
+    self_destructing: bool | None = None
+    media_kind: str | None = None
+    media_document_id: int | None = None
+    media_size: int | None = None
+    media_mime: str | None = None
+    media_filename: str | None = None
+    grouped_id: int | None = None
+
+
+FLUSH_BACKOFF_MIN = 0.5
+FLUSH_BACKOFF_MAX = 30.0
+
+MEDIA_COLUMNS = (
+    "media_kind",
+    "media_document_id",
+    "media_size",
+    "media_mime",
+    "media_filename",
+)
+
+
+def _row_values(kwargs: dict) -> dict:
+    return {
+        "id": kwargs["id"],
+        "from_id": kwargs["from_id"],
+        "chat_id": kwargs["chat_id"],
+        "type": kwargs["type"],
+        "msg_text": kwargs["msg_text"],
+        "media": kwargs["media"],
+        "noforwards": kwargs["noforwards"],
+        "self_destructing": kwargs["self_destructing"],
+        "created_at": kwargs["created_at"],
+        "edited_at": kwargs["edited_at"],
+        **{name: kwargs.get(name) for name in MEDIA_COLUMNS},
+        "grouped_id": kwargs.get("grouped_id"),
+        "peer_kind": peer_kind_for(kwargs["chat_id"]).value,
+    }
+
+
+# projections used by the handlers
+EDIT_FIELDS = ("from_id", "msg_text", "has_media")
+DELETED_FIELDS = ("from_id", "type", "msg_text", "has_media", "self_destructing", "grouped_id")
+
+
+def _event_row_from_values(values: dict, fields: Sequence[str] | None) -> MessageEventRow:
+    wanted = KEY_FIELDS.union(fields) if fields is not None else EVENT_FIELDS
+    return MessageEventRow(
+        *(
+            (values["media"] is not None if name == "has_media" else values[name])
+            if name in wanted
+            else None
+            for name in EVENT_FIELDS
+        )
+    )
 
 
 class MessageRepository:
-    def __init__(self, sqlite_url: str):
+    """With write_behind enabled, saved rows are queued and flushed in batches.
+
+    With partition_by_day enabled, rows are stored in per-day tables (see
+    database.partitions) and lookups fan out over them newest first.
+    """
+
+    def __init__(
+        self,
+        sqlite_url: str,
+        write_behind: bool = False,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        seen_index: SeenMessageIndex | None = None,
+        verify_query_plans: bool = False,
+        partition_by_day: bool = False,
+    ):
         self.sqlite_url = sqlite_url
+        self.write_behind = write_behind
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, max_pending)
+        self.seen_index = seen_index
+        self.verify_query_plans = verify_query_plans
+        self.partitions = MessagePartitions() if partition_by_day else None
+
+        # (chat_id, id) -> column values, in arrival order
+        self._pending: dict[tuple[int, int], dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_wakeup = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        self._flushed_rows = 0
+        self._flushed_batches = 0
+        # after a failed flush, inline and periodic flushes wait until _flush_retry_at
+        self._flush_backoff = 0.0
+        self._flush_retry_at = 0.0
+        self.flush_failures = 0
+        # rows before this rowid no longer hold pickled media
+        self._media_migration_rowid = 0
+        self.media_migration_done = False
+        self.media_migrated = 0
+        self.media_migration_failed = 0
+        # (table, chat type) the last unfinished retention pass stopped at
+        self._retention_resume: tuple[str, ChatType] | None = None
+        self.retention_backlog = False
+        self.retention_deleted = 0
+        self.retention_chunks = 0
+        self.retention_chunk_max_ms = 0.0
 
     async def init(self) -> None:
         await register_models()
+        if self.partitions is not None:
+            await self.partitions.load()
+        if self.verify_query_plans:
+            await check_query_plans()
+        if self.seen_index is not None:
+            await self.warm_seen_index()
+        if self.write_behind and self._flush_task is None:
+            self._flush_task = asyncio.create_task(
+                self._flush_loop(), name="db-write-behind"
+            )
+            logger.info(
+                "Write-behind enabled batch_size=%s flush_interval=%s max_pending=%s",
+                self.batch_size,
+                self.flush_interval,
+                self.max_pending,
+            )
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+        await self.flush()
+        if self._pending:
+            logger.error("Closing with unsaved messages pending=%s", len(self._pending))
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        stats = {
+            "write_behind": self.write_behind,
+            "pending_writes": self.pending_count,
+            "flushed_rows": self._flushed_rows,
+            "flushed_batches": self._flushed_batches,
+            "flush_failures": self.flush_failures,
+            "media_migration_done": self.media_migration_done,
+            "media_migrated": self.media_migrated,
+            "media_migration_failed": self.media_migration_failed,
+            "retention_deleted": self.retention_deleted,
+            "retention_chunks": self.retention_chunks,
+            "retention_chunk_max_ms": round(self.retention_chunk_max_ms, 1),
+            "retention_backlog": self.retention_backlog,
+        }
+        if self.seen_index is not None:
+            stats["seen_index"] = self.seen_index.stats()
+        if self.partitions is not None:
+            stats["partitions"] = self.partitions.stats()
+        return stats
+
+    def _tables(self) -> list[Table]:
+        return self.partitions.tables() if self.partitions is not None else [MESSAGES]
+
+    async def _table_for(self, created_at) -> Table:
+        if self.partitions is None:
+            return MESSAGES
+        return await self.partitions.table_for(created_at)
+
+    async def warm_seen_index(self) -> None:
+        index = self.seen_index
+        started = time.monotonic()
+        # a filter sized below the row count would be saturated, and rebuilt, at once
+        keys = len(self._pending)
+        for table in self._tables():
+            keys += await count_messages(table)
+        index.reset(keys)
+        for table in self._tables():
+            async for keys in iter_message_keys(table=table):
+                index.add_many(keys)
+        for chat_id, msg_id in self._pending:
+            index.add(chat_id, msg_id)
+        index.ready = True
+        logger.info(
+            "Seen-message index warmed keys=%s took_ms=%.1f",
+            index.stats()["bloom_count"],
+            (time.monotonic() - started) * 1000,
+        )
+
+    def _flush_backing_off(self) -> bool:
+        return time.monotonic() < self._flush_retry_at
+
+    async def _flush_loop(self) -> None:
+        while True:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(self._flush_wakeup.wait(), self.flush_interval)
+            self._flush_wakeup.clear()
+            if self._flush_backing_off():
+                await asyncio.sleep(self._flush_retry_at - time.monotonic())
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._pending:
+                keys = list(islice(self._pending, self.batch_size))
+                batch = [self._pending[key] for key in keys]
+                started = time.monotonic()
+                try:
+                    inserted = 0
+                    for table, rows in (await self._rows_by_table(batch)).items():
+                        inserted += await save_messages(rows, table)
+                except asyncio.CancelledError:
+                    raise
+                except OperationalError as exc:
+                    # e.g. "database is locked": keep the batch queued for the next flush;
+                    # rows a partial flush already inserted are skipped as duplicates
+                    self.flush_failures += 1
+                    self._flush_backoff = min(
+                        FLUSH_BACKOFF_MAX, max(FLUSH_BACKOFF_MIN, self._flush_backoff * 2)
+                    )
+                    self._flush_retry_at = time.monotonic() + self._flush_backoff
+                    logger.warning(
+                        "Keeping message batch for retry after flush error size=%s "
+                        "retry_in=%.1fs: %s",
+                        len(batch),
+                        self._flush_backoff,
+                        exc.orig,
+                    )
+                    return
+                except Exception:
+                    logger.exception(
+                        "Dropping message batch after flush error size=%s", len(batch)
+                    )
+                    inserted = 0
+                    if self.seen_index is not None:
+                        for chat_id, msg_id in keys:
+                            self.seen_index.forget(chat_id, msg_id)
+                self._flush_backoff = 0.0
+                self._flush_retry_at = 0.0
+                # rows stay visible to lookups until the batch has been committed
+                for key in keys:
+                    self._pending.pop(key, None)
+                self._flushed_rows += inserted
+                MESSAGES_SAVED.inc(amount=inserted)
+                self._flushed_batches += 1
+                logger.debug(
+                    "Flushed message batch size=%s inserted=%s pending=%s took_ms=%.1f",
+                    len(batch),
+                    inserted,
+                    len(self._pending),
+                    (time.monotonic() - started) * 1000,
+                )
+
+    async def _rows_by_table(self, rows: Sequence[dict]) -> dict[Table, list[dict]]:
+        if self.partitions is None:
+            return {MESSAGES: list(rows)}
+        grouped: dict[Table, list[dict]] = {}
+        for values in rows:
+            table = await self.partitions.table_for(values["created_at"])
+            grouped.setdefault(table, []).append(values)
+        return grouped
+
+    async def migrate_legacy_media(self, batch_size: int = 500, time_budget: float = 1.0) -> int:
+        """Re-encode pickled media rows and fill their metadata, a few batches per call."""
+        if self.media_migration_done:
+            return 0
+        deadline = time.monotonic() + time_budget
+        migrated = 0
+        while time.monotonic() < deadline:
+            rows = await get_media_batch(self._media_migration_rowid, batch_size)
+            if not rows:
+                self.media_migration_done = True
+                logger.info(
+                    "Legacy media migration finished migrated=%s failed=%s",
+                    self.media_migrated,
+                    self.media_migration_failed,
+                )
+                break
+            updates = []
+            for rowid, blob in rows:
+                if not is_legacy_blob(blob):
+                    continue
+                try:
+                    media = decode_media(blob)
+                    updates.append((rowid, {"media": encode_media(media), **media_columns(media)}))
+                except Exception as e:
+                    self.media_migration_failed += 1
+                    logger.debug("Failed to migrate media rowid=%s: %s", rowid, e)
+            await update_media_rows(updates)
+            self._media_migration_rowid = rows[-1][0]
+            migrated += len(updates)
+            self.media_migrated += len(updates)
+        if migrated:
+            logger.info(
+                "Migrated legacy media rows count=%s up_to_rowid=%s",
+                migrated,
+                self._media_migration_rowid,
+            )
+        return migrated
 
     async def message_exists(self, msg_id: int, chat_id: int) -> bool:
-        return await message_exists(msg_id, chat_id)
+        if (chat_id, msg_id) in self._pending:
+            return True
+        if self.seen_index is not None:
+            known = self.seen_index.lookup(chat_id, msg_id)
+            if known is not None:
+                return known
+        for table in self._tables():
+            if await message_exists(msg_id, chat_id, table):
+                return True
+        return False
 
     async def save_message(self, **kwargs) -> None:
-        await save_message(
-            msg_id=kwargs["id"],
-            from_id=kwargs["from_id"],
-            chat_id=kwargs["chat_id"],
-            type=kwargs["type"],
-            msg_text=kwargs["msg_text"],
-            media=kwargs["media"],
-            noforwards=kwargs["noforwards"],
-            self_destructing=kwargs["self_destructing"],
-            created_at=kwargs["created_at"],
-            edited_at=kwargs["edited_at"],
-        )
+        if not self.write_behind:
+            saved = await save_message(
+                msg_id=kwargs["id"],
+                from_id=kwargs["from_id"],
+                chat_id=kwargs["chat_id"],
+                type=kwargs["type"],
+                msg_text=kwargs["msg_text"],
+                media=kwargs["media"],
+                noforwards=kwargs["noforwards"],
+                self_destructing=kwargs["self_destructing"],
+                created_at=kwargs["created_at"],
+                edited_at=kwargs["edited_at"],
+                **{name: kwargs.get(name) for name in MEDIA_COLUMNS},
+                grouped_id=kwargs.get("grouped_id"),
+                peer_kind=peer_kind_for(kwargs["chat_id"]).value,
+                table=await self._table_for(kwargs["created_at"]),
+            )
+            if saved:
+                MESSAGES_SAVED.inc()
+                if self.seen_index is not None:
+                    self.seen_index.add(kwargs["chat_id"], kwargs["id"])
+            return
+
+        # first write wins, same as INSERT OR IGNORE on flush
+        self._pending.setdefault((kwargs["chat_id"], kwargs["id"]), _row_values(kwargs))
+        if self.seen_index is not None:
+            self.seen_index.add(kwargs["chat_id"], kwargs["id"])
+        if len(self._pending) >= self.max_pending:
+            if self._flush_backing_off():
+                # the last flush failed; the flush loop retries once the backoff ends
+                return
+            logger.warning(
+                "Write-behind queue is full pending=%s, flushing inline",
+                len(self._pending),
+            )
+            await self.flush()
+        elif len(self._pending) >= self.batch_size:
+            self._flush_wakeup.set()
+
+    def _pending_rows(self, chat_id: int | None, ids: Sequence[int]) -> list[dict]:
+        if not self._pending:
+            return []
+        if chat_id:
+            return [
+                self._pending[(chat_id, msg_id)]
+                for msg_id in ids
+                if (chat_id, msg_id) in self._pending
+            ]
+        wanted = set(ids)
+        return [
+            values
+            for (_, msg_id), values in self._pending.items()
+            if msg_id in wanted and values["peer_kind"] in ACCOUNT_PEER_KINDS
+        ]
 
     async def get_messages_by_event(
         self,
         chat_id: int | None,
         ids: Sequence[int],
         include_dm_where_chat_id_missing: bool = True,
-    ):
+        fields: Sequence[str] | None = None,
+    ) -> list[MessageEventRow]:
+        """Stored and pending rows for ids; fields limits the columns read (default all)."""
+
         class _Event:
             pass
 
         event = _Event()
         event.chat_id = chat_id
-        rows = await get_message_ids_by_event(event, list(ids))
-
-        result: list[MessageEventRow] = []
-        for row in rows:
-            mapping = getattr(row, "_mapping", {})
-
-            result.append(
-                MessageEventRow(
-                    id=mapping.get("id", row[0]),
-                    from_id=mapping.get("from_id", row[1]),
-                    chat_id=mapping.get("chat_id", row[2]),
-                    type=mapping.get("type", row[3]),
-                    msg_text=mapping.get("msg_text", row[4]),
-                    media=mapping.get("media", row[5]),
-                    noforwards=mapping.get("noforwards", row[6]),
-                    self_destructing=mapping.get("self_destructing", row[7]),
-                )
-            )
+        rows = []
+        remaining = list(ids)
+        for table in self._tables():
+            found = await get_message_ids_by_event(event, remaining, table, fields)
+            rows.extend(found)
+            # a message is stored once, in the partition of the day it arrived
+            found_ids = {row[0] for row in found}
+            remaining = [msg_id for msg_id in remaining if msg_id not in found_ids]
+            if not remaining:
+                break
+
+        result = [MessageEventRow(*row) for row in rows]
+        found = {(row.chat_id, row.id) for row in result}
+        for values in self._pending_rows(chat_id, ids):
+            if (values["chat_id"], values["id"]) not in found:
+                result.append(_event_row_from_values(values, fields))
 
         return result
 
-    async def delete_expired_messages(self, current_time):
-        await delete_expired_messages_from_db(current_time)
+    async def _drop_expired_partitions(self, cutoff) -> tuple[int, int]:
+        """Drop partitions whose whole day lies before cutoff; returns (partitions, rows)."""
+        dropped = rows = 0
+        for day in self.partitions.days():
+            if day_start(day + timedelta(days=1)) > cutoff:
+                break
+            rows += await self.partitions.drop(day)
+            dropped += 1
+        return dropped, rows
+
+    def _retention_work(self, cutoffs: dict) -> list[tuple[Table, ChatType]]:
+        work = []
+        for table in self._tables():
+            day = partition_day(table.name)
+            for chat_type, cutoff in cutoffs.items():
+                # partitions younger than the cutoff cannot hold expired rows
+                if day is None or day_start(day) < cutoff:
+                    work.append((table, chat_type))
+        resume = self._retention_resume
+        keys = [(table.name, chat_type) for table, chat_type in work]
+        if resume in keys:
+            start = keys.index(resume)
+            work = work[start:] + work[:start]
+            logger.debug(
+                "Resuming expired message deletion table=%s type=%s", resume[0], resume[1].name
+            )
+        return work
+
+    async def iter_messages_by_event(
+        self,
+        chat_id: int | None,
+        ids: Sequence[int],
+        chunk_size: int = 500,
+        fields: Sequence[str] | None = None,
+    ):
+        """Yield the rows of get_messages_by_event() one chunk of ids at a time."""
+        # leave room for the chat_id and peer_kind parameters
+        chunk_size = max(1, min(chunk_size, MAX_SQL_VARIABLES - 3))
+        for start in range(0, len(ids), chunk_size):
+            rows = await self.get_messages_by_event(
+                chat_id, ids[start : start + chunk_size], fields=fields
+            )
+            if rows:
+                yield rows
+
+    async def delete_expired_messages(
+        self, current_time, chunk_size: int = 1000, time_budget: float = 1.0
+    ) -> int:
+        """Delete expired rows in chunks, one chat type at a time, within time_budget.
+
+        Each chunk is its own short transaction and the loop yields in between, so
+        ingestion is never locked out for long. A pass that runs out of time resumes
+        with the same chat type on the next call. With partitions, days that expired
+        for every chat type are dropped first; the chunks only handle the chat types
+        with shorter retention. Returns the rows removed, dropped partitions included.
+        """
+        cutoffs = retention_cutoffs(current_time)
+        dropped = dropped_rows = 0
+        if self.partitions is not None:
+            dropped, dropped_rows = await self._drop_expired_partitions(min(cutoffs.values()))
+        deadline = time.monotonic() + time_budget
+        deleted = 0
+        # read the resume point before clearing it for this pass
+        work = self._retention_work(cutoffs)
+        self._retention_resume = None
+        for table, chat_type in work:
+            while True:
+                if deleted and time.monotonic() >= deadline:
+                    self._retention_resume = (table.name, chat_type)
+                    break
+                started = time.monotonic()
+                count = await delete_expired_chunk(
+                    chat_type, cutoffs[chat_type], chunk_size, table
+                )
+                took_ms = (time.monotonic() - started) * 1000
+                self.retention_chunks += 1
+                self.retention_chunk_max_ms = max(self.retention_chunk_max_ms, took_ms)
+                deleted += count
+                logger.debug(
+                    "Deleted expired chunk table=%s type=%s rows=%s took_ms=%.1f",
+                    table.name,
+                    chat_type.name,
+                    count,
+                    took_ms,
+                )
+                if count < chunk_size:
+                    break
+                await asyncio.sleep(0)
+            if self._retention_resume is not None:
+                break
+        self.retention_deleted += deleted + dropped_rows
+        self.retention_backlog = self._retention_resume is not None
+        if deleted or dropped:
+            logger.info(
+                "Deleted expired messages from DB count=%s partitions_dropped=%s "
+                "partition_rows=%s complete=%s",
+                deleted,
+                dropped,
+                dropped_rows,
+                not self.retention_backlog,
+            )
+        else:
+            logger.debug("No expired messages to delete from DB")
+
+        if self.seen_index is not None:
+            if self.seen_index.saturated:
+                # the Bloom filter cannot forget keys, rebuild it from what is left
+                await self.warm_seen_index()
+            elif deleted or dropped:
+                self.seen_index.clear_recent()
+        return deleted + dropped_rows
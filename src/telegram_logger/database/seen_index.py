@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import struct
+from collections import OrderedDict
+
+_KEY = struct.Struct("<qq")
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = min(max(error_rate, 1e-6), 0.5)
+        num_bits = math.ceil(
+            -self.capacity * math.log(self.error_rate) / (math.log(2) ** 2)
+        )
+        self.num_bits = max(64, num_bits)
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: bytes) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def saturated(self) -> bool:
+        return self.count > self.capacity
+
+
+class SeenMessageIndex:
+    """Tracks stored (chat_id, id) pairs: an LRU of recent keys plus a Bloom filter.
+
+    lookup() returns True when the key is known to be stored, False when it is known
+    not to be, and None when only the database can tell.
+    """
+
+    def __init__(
+        self, expected_messages: int, recent_size: int, error_rate: float = 0.01
+    ):
+        self.expected_messages = expected_messages
+        self.recent_size = max(1, recent_size)
+        self.error_rate = error_rate
+        self.ready = False
+        self.hits = 0
+        self.misses = 0
+        self.fallthroughs = 0
+        self._recent: OrderedDict[tuple[int, int], None] = OrderedDict()
+        self._bloom = BloomFilter(expected_messages, error_rate)
+
+    def reset(self, keys: int = 0) -> None:
+        """Start empty, sized for keys with room to grow (at least expected_messages)."""
+        self.ready = False
+        self._recent.clear()
+        capacity = max(self.expected_messages, 2 * keys)
+        self._bloom = BloomFilter(capacity, self.error_rate)
+
+    def clear_recent(self) -> None:
+        self._recent.clear()
+
+    @property
+    def saturated(self) -> bool:
+        return self._bloom.saturated
+
+    def add(self, chat_id: int, msg_id: int) -> None:
+        key = (chat_id, msg_id)
+        self._recent[key] = None
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+        self._bloom.add(_KEY.pack(chat_id, msg_id))
+
+    def forget(self, chat_id: int, msg_id: int) -> None:
+        """Drop a key from the recent set; the Bloom filter only ever sends it to the DB."""
+        self._recent.pop((chat_id, msg_id), None)
+
+    def add_many(self, keys) -> None:
+        for chat_id, msg_id in keys:
+            self._bloom.add(_KEY.pack(chat_id, msg_id))
+
+    def lookup(self, chat_id: int, msg_id: int) -> bool | None:
+        if not self.ready:
+            return None
+        key = (chat_id, msg_id)
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            self.hits += 1
+            return True
+        if _KEY.pack(chat_id, msg_id) not in self._bloom:
+            self.misses += 1
+            return False
+        self.fallthroughs += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "recent": len(self._recent),
+            "bloom_count": self._bloom.count,
+            "bloom_capacity": self._bloom.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallthroughs": self.fallthroughs,
+        }
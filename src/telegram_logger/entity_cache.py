@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+def display_name(entity, fallback: str) -> str:
+    return (
+        getattr(entity, "username", None)
+        or getattr(entity, "title", None)
+        or "_".join(
+            filter(
+                None,
+                [
+                    getattr(entity, "first_name", None),
+                    getattr(entity, "last_name", None),
+                ],
+            )
+        )
+        or fallback
+    )
+
+
+@dataclass(slots=True)
+class _Entry:
+    expires_at: float
+    entity: object | None
+    error: str | None = None
+
+
+class EntityCache:
+    """TTL + LRU cache in front of client.get_entity.
+
+    Concurrent lookups of the same id share one request. "Not found" (ValueError) is
+    cached for negative_ttl and raised again as ValueError, like get_entity does.
+    """
+
+    def __init__(
+        self,
+        client,
+        ttl: float = 900,
+        negative_ttl: float = 120,
+        max_size: int = 10000,
+    ):
+        self.client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._inflight: dict[int, asyncio.Future] = {}
+
+    def _store(self, entity_id: int, entry: _Entry) -> None:
+        self._entries[entity_id] = entry
+        self._entries.move_to_end(entity_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_entity(self, entity_id: int):
+        entry = self._entries.get(entity_id)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(entity_id)
+                if entry.error is not None:
+                    raise ValueError(entry.error)
+                return entry.entity
+            del self._entries[entity_id]
+
+        pending = self._inflight.get(entity_id)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[entity_id] = future
+        try:
+            entity = await self.client.get_entity(entity_id)
+        except ValueError as e:
+            logger.debug("Caching missing entity id=%s: %s", entity_id, e)
+            self._store(
+                entity_id, _Entry(time.monotonic() + self.negative_ttl, None, str(e))
+            )
+            future.set_exception(ValueError(str(e)))
+            raise
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        else:
+            self._store(entity_id, _Entry(time.monotonic() + self.ttl, entity))
+            future.set_result(entity)
+            return entity
+        finally:
+            self._inflight.pop(entity_id, None)
+            if future.done() and not future.cancelled():
+                # mark the exception as retrieved when nobody else was waiting
+                future.exception()
+
+    async def chat_name(self, chat_id: int) -> str:
+        try:
+            entity = await self.get_entity(chat_id)
+        except Exception:
+            return str(chat_id)
+        return display_name(entity, str(chat_id))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
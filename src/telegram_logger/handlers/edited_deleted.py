@@ -3,17 +3,25 @@ from __future__ import annotations
 import logging
 import os
 import re
-from contextlib import suppress
+from dataclasses import dataclass
 
 from telethon import events
 from telethon.errors import FileMigrateError, FileReferenceExpiredError
+from telethon.extensions import markdown
+from telethon.helpers import add_surrogate
 from telethon.hints import Entity
 from telethon.tl import types
 
+from telegram_logger.database.repository import DELETED_FIELDS, EDIT_FIELDS
+from telegram_logger.entity_cache import EntityCache
+from telegram_logger.handlers.packing import DeletedTextPacker
+from telegram_logger.outbound import DirectSender
 from telegram_logger.tg_types import ChatType
 
 logger = logging.getLogger(__name__)
 KNOWN_CHAT_TYPES = {chat_type.value for chat_type in ChatType}
+ALBUM_SIZE = 10
+CAPTION_LIMIT = 1024
 
 
 def _escape_md_label(text: str) -> str:
@@ -23,17 +31,11 @@ def _escape_md_label(text: str) -> str:
     return value
 
 
-def _remove_file_quietly(path: str) -> None:
-    if path:
-        with suppress(FileNotFoundError):
-            os.remove(path)
-
-
-def _ids_from_event(event, limit: int) -> list[int]:
+def _ids_from_event(event) -> list[int]:
     if isinstance(event, events.MessageDeleted.Event):
-        return event.deleted_ids[:limit]
+        return list(event.deleted_ids)
     if isinstance(event, types.UpdateReadMessagesContents):
-        return event.messages[:limit]
+        return list(event.messages)
     if isinstance(event, events.MessageEdited.Event):
         return [event.message.id]
     return []
@@ -43,42 +45,27 @@ def _safe_name(name: str) -> str:
     return re.sub(r"[^\w\-. ()\[\]{}@,+=]", "_", name or "") or "file.bin"
 
 
-async def _friendly_filename(client, chat_id: int, fallback_name: str) -> str:
-    try:
-        entity = await client.get_entity(chat_id)
-        chat_name = (
-            getattr(entity, "username", None)
-            or getattr(entity, "title", None)
-            or "_".join(
-                filter(
-                    None,
-                    [
-                        getattr(entity, "first_name", None),
-                        getattr(entity, "last_name", None),
-                    ],
-                )
-            )
-            or str(chat_id)
-        )
-    except Exception:
-        chat_name = str(chat_id)
+async def _friendly_filename(entities, chat_id: int, fallback_name: str) -> str:
+    chat_name = await entities.chat_name(chat_id)
 
     base_name = os.path.basename(fallback_name)
     parts = base_name.split("_", 2)
     if len(parts) >= 3 and parts[0].lstrip("-").isdigit() and parts[1].isdigit():
         base_name = parts[2]
+    elif len(parts) >= 2 and parts[0].isdigit():
+        base_name = base_name.split("_", 1)[1]
     return f"{_safe_name(chat_name)}_{_safe_name(base_name)}"
 
 
 async def _create_mention(
-    client, entity_id: int, chat_msg_id: int | None = None
+    entities, entity_id: int, chat_msg_id: int | None = None
 ) -> str:
     msg_id = 1 if chat_msg_id is None else chat_msg_id
     if entity_id == 0:
         return "Unknown"
 
     try:
-        entity: Entity = await client.get_entity(entity_id)
+        entity: Entity = await entities.get_entity(entity_id)
 
         if isinstance(entity, (types.Channel, types.Chat)):
             title = (getattr(entity, "title", None) or f"Chat {entity_id}").strip()
@@ -137,12 +124,16 @@ async def _create_mention(
         return str(entity_id)
 
 
-async def _safe_send(client, chat_id: int, text: str, limit: int = 4096):
+async def _safe_send(
+    sender, chat_id: int, text: str, source_chat_id: int = 0, limit: int = 4096
+):
     if not text:
         return
     if len(text) > limit:
         text = text[: limit - 3] + "..."
-    await client.send_message(chat_id, text, parse_mode="md", link_preview=False)
+    await sender.send_message(
+        source_chat_id, chat_id, text, parse_mode="md", link_preview=False
+    )
 
 
 async def _refetch_message(
@@ -160,16 +151,19 @@ async def _refetch_message(
 async def _send_deleted_file(
     client,
     log_chat_id: int,
-    file_path: str,
+    file,
     caption: str,
     chat_id: int,
+    entities,
     display_name: str | None = None,
+    file_size: int | None = None,
 ):
-    name_for_caption = display_name or os.path.basename(file_path)
-    filename = await _friendly_filename(client, chat_id, name_for_caption)
+    name_for_caption = display_name or os.path.basename(file)
+    filename = await _friendly_filename(entities, chat_id, name_for_caption)
     await client.send_file(
         log_chat_id,
-        file_path,
+        file,
+        file_size=file_size,
         caption=caption,
         parse_mode="md",
         attributes=[types.DocumentAttributeFilename(file_name=filename)],
@@ -178,6 +172,156 @@ async def _send_deleted_file(
     )
 
 
+@dataclass(slots=True)
+class _DeletedMedia:
+    row: object
+    src: str
+    header: str
+    body: str
+    enc_path: str | None = None
+
+    @property
+    def caption(self) -> str:
+        return self.header + (f"**Message:**\n{self.body}" if self.body else "")
+
+
+async def _encrypt_deleted_media(deleted_storage, item: _DeletedMedia) -> bool:
+    if not deleted_storage:
+        return True
+    item.enc_path = await deleted_storage.deleted_put_from_buffer(item.src)
+    if not item.enc_path:
+        logger.error(
+            "Failed to encrypt deleted media id=%s chat_id=%s",
+            item.row.id,
+            item.row.chat_id,
+        )
+        return False
+    return True
+
+
+async def _send_deleted_media(
+    client,
+    sender,
+    log_chat_id: int,
+    deleted_storage,
+    buffer_storage,
+    entities,
+    item: _DeletedMedia,
+) -> bool:
+    row = item.row
+    name = os.path.basename(item.src)
+
+    async def _upload():
+        if not item.enc_path:
+            await _send_deleted_file(
+                client, log_chat_id, item.src, item.caption, row.chat_id, entities
+            )
+            return
+        # opened per attempt: a flood-wait retry needs a fresh stream
+        async with deleted_storage.deleted_open_for_upload(item.enc_path, name=name) as reader:
+            await _send_deleted_file(
+                client,
+                log_chat_id,
+                reader,
+                item.caption,
+                row.chat_id,
+                entities,
+                display_name=name,
+                file_size=reader.size,
+            )
+
+    try:
+        await sender.call(row.chat_id, _upload)
+    except Exception as e:
+        logger.exception(
+            "Failed to upload deleted media id=%s chat_id=%s path=%s: %s",
+            row.id,
+            row.chat_id,
+            item.enc_path or item.src,
+            e,
+        )
+        return False
+    await buffer_storage.buffer_remove(item.src)
+    logger.info("Processed deleted media message id=%s chat_id=%s", row.id, row.chat_id)
+    return True
+
+
+def _album_captions(items: list[_DeletedMedia]) -> list[str]:
+    """One combined caption on the first file, or per-file captions if it is too long."""
+    bodies = [f"**Message:**\n{item.body}" for item in items if item.body]
+    combined = items[0].header + "\n".join(bodies)
+    text, _ = markdown.parse(combined)
+    if len(add_surrogate(text)) <= CAPTION_LIMIT:
+        return [combined]
+    return [item.caption for item in items]
+
+
+async def _upload_album_file(client, deleted_storage, entities, item: _DeletedMedia):
+    name = os.path.basename(item.src)
+    filename = await _friendly_filename(entities, item.row.chat_id, name)
+    if not item.enc_path:
+        return await client.upload_file(item.src, file_name=filename)
+    async with deleted_storage.deleted_open_for_upload(item.enc_path, name=name) as reader:
+        return await client.upload_file(reader, file_size=reader.size, file_name=filename)
+
+
+async def _send_deleted_album(
+    client,
+    sender,
+    log_chat_id: int,
+    deleted_storage,
+    buffer_storage,
+    entities,
+    items: list[_DeletedMedia],
+) -> None:
+    chat_id = items[0].row.chat_id
+    grouped_id = items[0].row.grouped_id
+    for start in range(0, len(items), ALBUM_SIZE):
+        chunk = items[start : start + ALBUM_SIZE]
+        if len(chunk) == 1:
+            await _send_deleted_media(
+                client, sender, log_chat_id, deleted_storage, buffer_storage, entities, chunk[0]
+            )
+            continue
+
+        async def _upload(chunk=chunk):
+            files = [
+                await _upload_album_file(client, deleted_storage, entities, item)
+                for item in chunk
+            ]
+            await client.send_file(
+                log_chat_id,
+                files,
+                caption=_album_captions(chunk),
+                parse_mode="md",
+                force_document=True,
+            )
+
+        try:
+            await sender.call(chat_id, _upload)
+        except Exception as e:
+            logger.warning(
+                "Album upload failed, sending files one by one chat_id=%s grouped_id=%s: %s",
+                chat_id,
+                grouped_id,
+                e,
+            )
+            for item in chunk:
+                await _send_deleted_media(
+                    client, sender, log_chat_id, deleted_storage, buffer_storage, entities, item
+                )
+            continue
+
+        for item in chunk:
+            await buffer_storage.buffer_remove(item.src)
+        logger.info(
+            "Processed deleted album chat_id=%s grouped_id=%s files=%s",
+            chat_id,
+            grouped_id,
+            len(chunk),
+        )
+
+
 def _should_save_deleted_message(row, settings) -> bool:
     chat_type = (
         ChatType(row.type) if row.type in KNOWN_CHAT_TYPES else ChatType.UNKNOWN
@@ -194,29 +338,42 @@ def _should_save_deleted_message(row, settings) -> bool:
 
 
 async def edited_deleted_handler(
-    event, client, db, buffer_storage, deleted_storage, settings, my_id
+    event,
+    client,
+    db,
+    buffer_storage,
+    deleted_storage,
+    settings,
+    my_id,
+    entity_cache: EntityCache | None = None,
+    downloads=None,
+    outbound=None,
+    text_packer: DeletedTextPacker | None = None,
 ):
+    entities = entity_cache or EntityCache(client)
+    sender = outbound or DirectSender(client)
     if isinstance(event, events.MessageEdited.Event):
         if not settings.save_edited_messages:
             logger.debug("Edited message processing disabled")
             return
         ids = [event.message.id]
-        rows = await db.get_messages_by_event(event.chat_id, ids)
+        rows = await db.get_messages_by_event(event.chat_id, ids, fields=EDIT_FIELDS)
         for row in rows:
-            if row.media:
+            if row.has_media:
                 continue
             old_text = str(row.msg_text or "").strip()
             new_text = (event.message.text or "").strip()
             if old_text != new_text:
-                mention_sender = await _create_mention(client, row.from_id)
-                mention_chat = await _create_mention(client, row.chat_id, row.id)
+                mention_sender = await _create_mention(entities, row.from_id)
+                mention_chat = await _create_mention(entities, row.chat_id, row.id)
                 await _safe_send(
-                    client,
+                    sender,
                     settings.log_chat_id,
                     f"**✏ Edited text message from:** {mention_sender}\n"
                     f"in {mention_chat}\n"
                     f"**Before:**\n```{old_text}```\n"
                     f"**After:**\n```{new_text}```",
+                    source_chat_id=row.chat_id,
                 )
         return
 
@@ -234,126 +391,140 @@ async def edited_deleted_handler(
         )
         return
 
-    ids = _ids_from_event(event, settings.max_deleted_messages_per_event)
+    ids = _ids_from_event(event)
+    limit = settings.max_deleted_messages_per_event
+    if 0 < limit < len(ids):
+        logger.warning(
+            "Deletion event has %s ids, processing only the first %s",
+            len(ids),
+            limit,
+        )
+        ids = ids[:limit]
     logger.debug(
         "Processing deletion-related event=%s ids_count=%s",
         type(event).__name__,
         len(ids),
     )
-    rows = await db.get_messages_by_event(getattr(event, "chat_id", None), ids)
 
-    for row in rows:
-        if row.from_id in settings.ignored_ids or row.chat_id in settings.ignored_ids:
-            logger.debug(
-                "Skipping row id=%s chat_id=%s due to ignored_ids", row.id, row.chat_id
-            )
-            continue
-
-        if (
-            isinstance(event, types.UpdateReadMessagesContents)
-            and not row.self_destructing
-        ):
-            logger.debug("Skipping non-self-destruct row id=%s for TTL event", row.id)
-            continue
-
-        if not _should_save_deleted_message(row, settings):
-            logger.debug(
-                "Skipping deleted message id=%s chat_id=%s type=%s due to save flags",
-                row.id,
-                row.chat_id,
-                row.type,
-            )
-            continue
+    packer = text_packer
+    if packer is None and settings.pack_deleted_text_messages:
+        packer = DeletedTextPacker(sender, settings.log_chat_id)
+    # (chat_id, grouped_id) -> album items, sent after the other rows of the event
+    albums: dict[tuple[int, int], list[_DeletedMedia]] = {}
+
+    # rows arrive a chunk of ids at a time, so a mass deletion never loads all at once
+    chunks = db.iter_messages_by_event(
+        getattr(event, "chat_id", None),
+        ids,
+        settings.deleted_lookup_chunk_size,
+        fields=DELETED_FIELDS,
+    )
+    async for rows in chunks:
+        for row in rows:
+            if row.from_id in settings.ignored_ids or row.chat_id in settings.ignored_ids:
+                logger.debug(
+                    "Skipping row id=%s chat_id=%s due to ignored_ids", row.id, row.chat_id
+                )
+                continue
 
-        mention_sender = await _create_mention(client, row.from_id)
-        mention_chat = await _create_mention(client, row.chat_id, row.id)
+            if (
+                isinstance(event, types.UpdateReadMessagesContents)
+                and not row.self_destructing
+            ):
+                logger.debug("Skipping non-self-destruct row id=%s for TTL event", row.id)
+                continue
 
-        if row.media:
-            src = buffer_storage.buffer_find(row.id, row.chat_id)
-            if not src:
-                fresh = await _refetch_message(
-                    client,
-                    row.chat_id,
-                    row.id,
-                    settings.listen_outgoing_messages,
-                )
-                if fresh and getattr(fresh, "media", None):
-                    src = await buffer_storage.buffer_save(fresh)
-            if not src:
-                logger.info(
-                    "Media for deleted message id=%s chat_id=%s not found in buffer",
+            if not _should_save_deleted_message(row, settings):
+                logger.debug(
+                    "Skipping deleted message id=%s chat_id=%s type=%s due to save flags",
                     row.id,
                     row.chat_id,
+                    row.type,
                 )
                 continue
 
-            header = f"**Deleted message from:** {mention_sender}\nin {mention_chat}\n"
-            body = str(row.msg_text or "").strip()
-            caption = header + (f"**Message:**\n{body}" if body else "")
-
-            if deleted_storage:
-                enc_path = await deleted_storage.deleted_put_from_buffer(src)
-                if not enc_path:
-                    logger.error(
-                        "Failed to encrypt deleted media id=%s chat_id=%s",
-                        row.id,
-                        row.chat_id,
-                    )
-                    continue
+            mention_sender = await _create_mention(entities, row.from_id)
+            mention_chat = await _create_mention(entities, row.chat_id, row.id)
 
-                try:
-                    with deleted_storage.deleted_open_for_upload(enc_path) as f:
-                        tmp_path = getattr(f, "name", src)
-                        await _send_deleted_file(
-                            client,
-                            settings.log_chat_id,
-                            tmp_path,
-                            caption,
-                            row.chat_id,
-                            display_name=os.path.basename(src),
-                        )
-                except Exception as e:
-                    logger.exception(
-                        "Failed to upload encrypted deleted media id=%s chat_id=%s enc_path=%s: %s",
-                        row.id,
-                        row.chat_id,
-                        enc_path,
-                        e,
-                    )
-                    continue
-                else:
-                    _remove_file_quietly(src)
-            else:
-                try:
-                    await _send_deleted_file(
+            if row.has_media:
+                src = buffer_storage.buffer_find(row.id, row.chat_id)
+                if not src and downloads is not None:
+                    src = await downloads.wait_for(row.chat_id, row.id)
+                if not src:
+                    fresh = await _refetch_message(
                         client,
-                        settings.log_chat_id,
-                        src,
-                        caption,
                         row.chat_id,
+                        row.id,
+                        settings.listen_outgoing_messages,
                     )
-                except Exception as e:
-                    logger.exception(
-                        "Failed to upload deleted media id=%s chat_id=%s path=%s: %s",
+                    if fresh and getattr(fresh, "media", None):
+                        src = await buffer_storage.buffer_save(fresh)
+                if not src:
+                    logger.info(
+                        "Media for deleted message id=%s chat_id=%s not found in buffer",
                         row.id,
                         row.chat_id,
-                        src,
-                        e,
                     )
                     continue
-                else:
-                    _remove_file_quietly(src)
-            logger.info(
-                "Processed deleted media message id=%s chat_id=%s", row.id, row.chat_id
-            )
-        elif row.msg_text:
-            await _safe_send(
-                client,
-                settings.log_chat_id,
-                f"**Deleted message from:** {mention_sender}\n"
-                f"in {mention_chat}\n"
-                f"**Message:**\n{row.msg_text}",
-            )
-            logger.info(
-                "Processed deleted text message id=%s chat_id=%s", row.id, row.chat_id
-            )
+
+                item = _DeletedMedia(
+                    row,
+                    src,
+                    header=f"**Deleted message from:** {mention_sender}\nin {mention_chat}\n",
+                    body=str(row.msg_text or "").strip(),
+                )
+                if not await _encrypt_deleted_media(deleted_storage, item):
+                    continue
+                if row.grouped_id and settings.group_deleted_albums:
+                    albums.setdefault((row.chat_id, row.grouped_id), []).append(item)
+                    continue
+                await _send_deleted_media(
+                    client,
+                    sender,
+                    settings.log_chat_id,
+                    deleted_storage,
+                    buffer_storage,
+                    entities,
+                    item,
+                )
+            elif row.msg_text and packer is not None:
+                packer.add(
+                    row.chat_id,
+                    row.from_id,
+                    f"**Deleted message from:** {mention_sender}\nin {mention_chat}",
+                    f"**Message:**\n{row.msg_text}",
+                )
+                logger.info(
+                    "Queued deleted text message id=%s chat_id=%s", row.id, row.chat_id
+                )
+            elif row.msg_text:
+                await _safe_send(
+                    sender,
+                    settings.log_chat_id,
+                    f"**Deleted message from:** {mention_sender}\n"
+                    f"in {mention_chat}\n"
+                    f"**Message:**\n{row.msg_text}",
+                    source_chat_id=row.chat_id,
+                )
+                logger.info(
+                    "Processed deleted text message id=%s chat_id=%s", row.id, row.chat_id
+                )
+
+        if packer is not None:
+            await packer.event_done()
+        # let queued log sends drain before looking up the next chunk
+        await sender.wait_for_room(settings.deleted_send_backlog_limit)
+
+    for items in albums.values():
+        await _send_deleted_album(
+            client,
+            sender,
+            settings.log_chat_id,
+            deleted_storage,
+            buffer_storage,
+            entities,
+            items,
+        )
+
+    if packer is not None:
+        await packer.event_done()
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import logging
-import pickle
 from datetime import datetime, timezone
 
 from telethon.events import MessageEdited
 from telethon.tl import types
 
+from telegram_logger.database.media_codec import encode_media, media_columns
 from telegram_logger.handlers.restricted_saver import maybe_handle_restricted_link
+from telegram_logger.storage.downloads import DownloadPriority
 from telegram_logger.tg_types import ChatType
 
 logger = logging.getLogger(__name__)
@@ -42,8 +43,23 @@ async def _noop_save_restricted(_link: str) -> None:
     return None
 
 
+def _download_priority(self_destruct: bool, noforwards: bool) -> DownloadPriority:
+    if self_destruct:
+        return DownloadPriority.SELF_DESTRUCT
+    if noforwards:
+        return DownloadPriority.NOFORWARDS
+    return DownloadPriority.BULK
+
+
 async def new_message_handler(
-    event, client, db, buffer_storage, settings, my_id, save_restricted_fn=None
+    event,
+    client,
+    db,
+    buffer_storage,
+    settings,
+    my_id,
+    save_restricted_fn=None,
+    downloads=None,
 ):
     if save_restricted_fn is None:
         save_restricted_fn = _noop_save_restricted
@@ -97,9 +113,20 @@ async def new_message_handler(
         or should_buffer_noforwards
         or settings.buffer_all_media
     ):
-        await buffer_storage.buffer_save(event.message)
+        if downloads is not None:
+            downloads.submit(
+                event.message,
+                _download_priority(should_buffer_self_destruct, should_buffer_noforwards),
+            )
+        else:
+            await buffer_storage.buffer_save(
+                event.message,
+                reason=_download_priority(
+                    should_buffer_self_destruct, should_buffer_noforwards
+                ).name.lower(),
+            )
         logger.debug(
-            "Buffered media id=%s chat_id=%s reason_self_destruct=%s reason_noforwards=%s reason_buffer_all=%s",
+            "Buffering media id=%s chat_id=%s reason_self_destruct=%s reason_noforwards=%s reason_buffer_all=%s",
             event.message.id,
             chat_id,
             should_buffer_self_destruct,
@@ -119,7 +146,9 @@ async def new_message_handler(
         chat_id=chat_id,
         type=(await _chat_type(event)).value,
         msg_text=event.message.text,
-        media=pickle.dumps(media) if media else None,
+        media=encode_media(media),
+        **media_columns(media),
+        grouped_id=event.message.grouped_id,
         noforwards=noforwards,
         self_destructing=self_destructing,
         created_at=datetime.now(timezone.utc),
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+from collections import OrderedDict
+from typing import Sequence
+
+from telethon.extensions import markdown
+from telethon.helpers import add_surrogate
+from telethon.utils import split_text
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+MAX_ENTITIES = 100
+SEPARATOR = "\n\n"
+
+
+class _Message:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.parts: list[str] = []
+        self.entities: list = []
+        self.length = 0
+
+    def fits(self, length: int, entities: int) -> bool:
+        extra = len(SEPARATOR) if self.parts else 0
+        return (
+            self.length + extra + length <= self.limit
+            and len(self.entities) + entities <= MAX_ENTITIES
+        )
+
+    def add(self, text: str, entities: Sequence, length: int) -> None:
+        if self.parts:
+            self.length += len(SEPARATOR)
+        for entity in entities:
+            entity = copy.copy(entity)
+            entity.offset += self.length
+            self.entities.append(entity)
+        self.parts.append(text)
+        self.length += length
+
+    def build(self) -> tuple[str, list]:
+        return SEPARATOR.join(self.parts), self.entities
+
+
+def _parse(md: str) -> tuple[str, list, int]:
+    text, entities = markdown.parse(md)
+    # entity offsets count UTF-16 code units, so lengths must too
+    return text, entities, len(add_surrogate(text))
+
+
+def pack_markdown(
+    groups: Sequence[tuple[str, Sequence[str]]], limit: int = MESSAGE_LIMIT
+) -> list[tuple[str, list]]:
+    """Pack (header, entries) groups of markdown into as few messages as possible.
+
+    Messages break only between entries, and a message that continues a group starts
+    with the group header again. An entry too long to fit next to its header is split
+    by telethon.utils.split_text, which keeps the formatting valid on both sides.
+    Returns (text, entities) pairs for send_message(formatting_entities=...).
+    """
+    messages: list[tuple[str, list]] = []
+    current = _Message(limit)
+
+    def flush():
+        nonlocal current
+        if current.parts:
+            messages.append(current.build())
+        current = _Message(limit)
+
+    for header_md, entries in groups:
+        header, header_entities, header_length = _parse(header_md)
+        header_in_current = False
+        for entry_md in entries:
+            text, entities, length = _parse(entry_md)
+            if not text:
+                continue
+            need = length if header_in_current else header_length + len(SEPARATOR) + length
+            need_entities = len(entities) + (0 if header_in_current else len(header_entities))
+            if current.fits(need, need_entities):
+                if not header_in_current:
+                    current.add(header, header_entities, header_length)
+                    header_in_current = True
+                current.add(text, entities, length)
+                continue
+
+            flush()
+            if current.fits(header_length + len(SEPARATOR) + length, need_entities):
+                current.add(header, header_entities, header_length)
+                current.add(text, entities, length)
+                header_in_current = True
+                continue
+
+            piece_limit = max(1, limit - header_length - len(SEPARATOR))
+            for piece, piece_entities in split_text(
+                text,
+                entities,
+                limit=piece_limit,
+                max_entities=max(1, MAX_ENTITIES - len(header_entities)),
+            ):
+                current.add(header, header_entities, header_length)
+                current.add(piece, piece_entities, len(add_surrogate(piece)))
+                flush()
+            header_in_current = False
+    flush()
+    return messages
+
+
+class DeletedTextPacker:
+    """Collects deleted-text notifications and sends them packed.
+
+    Entries are grouped by (chat_id, sender_id) in arrival order. With window=0 the
+    caller flushes at the end of each event; otherwise the first entry starts a timer
+    and everything added within window seconds goes out together.
+    """
+
+    def __init__(self, sender, log_chat_id: int, window: float = 0.0, limit: int = MESSAGE_LIMIT):
+        self.sender = sender
+        self.log_chat_id = log_chat_id
+        self.window = window
+        self.limit = limit
+        self._groups: OrderedDict[tuple[int, int], tuple[str, list[str]]] = OrderedDict()
+        self._timer: asyncio.Task | None = None
+        self.entries = 0
+        self.messages = 0
+
+    def add(self, chat_id: int, sender_id: int, header_md: str, entry_md: str) -> None:
+        group = self._groups.get((chat_id, sender_id))
+        if group is None:
+            group = self._groups[(chat_id, sender_id)] = (header_md, [])
+        group[1].append(entry_md)
+
+    async def event_done(self) -> None:
+        if not self._groups:
+            return
+        if self.window <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later(), name="deleted-text-packer")
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to send packed deleted messages")
+
+    async def flush(self) -> None:
+        if not self._groups:
+            return
+        groups, self._groups = self._groups, OrderedDict()
+        # the first chat of the batch orders it among that chat's other log sends
+        source_chat_id = next(iter(groups))[0]
+        packed = pack_markdown(list(groups.values()), self.limit)
+        entries = sum(len(entries) for _, entries in groups.values())
+        self.entries += entries
+        self.messages += len(packed)
+        logger.debug(
+            "Sending packed deleted messages entries=%s messages=%s", entries, len(packed)
+        )
+        for text, entities in packed:
+            await self.sender.send_message(
+                source_chat_id,
+                self.log_chat_id,
+                text,
+                formatting_entities=entities,
+                link_preview=False,
+            )
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_entries": sum(len(entries) for _, entries in self._groups.values()),
+            "entries": self.entries,
+            "messages": self.messages,
+        }
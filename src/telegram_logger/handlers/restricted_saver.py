@@ -8,6 +8,8 @@ from urllib.parse import parse_qs, urlparse
 
 from telethon.errors import ChatForwardsRestrictedError
 
+from telegram_logger.outbound import DirectSender
+
 logger = logging.getLogger(__name__)
 
 TG_RE_HTTP = re.compile(r"https?://t\.me/(?:c/\d+/\d+|[\w\d_]+/\d+)")
@@ -72,9 +74,10 @@ def parse_restricted_link(link: str) -> tuple[Optional[int | str], Optional[int]
 
 
 async def save_restricted_msg(
-    link: str, client, buffer_storage, target_chat_id: int
+    link: str, client, buffer_storage, target_chat_id: int, outbound=None
 ) -> None:
     logger.debug("Processing restricted link: %s", link)
+    sender = outbound or DirectSender(client)
     chat_id, msg_id = parse_restricted_link(link)
     if chat_id is None or msg_id is None:
         logger.warning("Cannot parse link: %s", link)
@@ -106,7 +109,9 @@ async def save_restricted_msg(
             )
 
         try:
-            await client.send_file(target_chat_id, msg.media, caption=msg.text or "")
+            await sender.send_file(
+                chat_id, target_chat_id, msg.media, caption=msg.text or ""
+            )
             logger.info(
                 "Saved restricted media by link=%s to chat_id=%s", link, target_chat_id
             )
@@ -115,7 +120,9 @@ async def save_restricted_msg(
             pass
 
         if local_path and os.path.exists(local_path):
-            await client.send_file(target_chat_id, local_path, caption=msg.text or "")
+            await sender.send_file(
+                chat_id, target_chat_id, local_path, caption=msg.text or ""
+            )
             logger.info(
                 "Saved restricted media from buffer by link=%s to chat_id=%s",
                 link,
@@ -128,7 +135,9 @@ async def save_restricted_msg(
         )
         with tempfile.NamedTemporaryFile("wb", suffix=suffix, delete=True) as tmp:
             await client.download_media(msg.media, file=tmp.name)
-            await client.send_file(target_chat_id, tmp.name, caption=msg.text or "")
+            await sender.send_file(
+                chat_id, target_chat_id, tmp.name, caption=msg.text or ""
+            )
             logger.info(
                 "Saved restricted media via fallback download by link=%s to chat_id=%s",
                 link,
@@ -137,7 +146,7 @@ async def save_restricted_msg(
         return
 
     if msg.text:
-        await client.send_message(target_chat_id, msg.text)
+        await sender.send_message(chat_id, target_chat_id, msg.text)
         logger.info(
             "Saved restricted text by link=%s to chat_id=%s", link, target_chat_id
         )
@@ -1,4 +1,5 @@
 from telegram_logger.health.beats import beat_housekeeping
 from telegram_logger.health.healthcheck import setup_healthcheck
+from telegram_logger.health.stats import collect_stats, register_stats
 
-__all__ = ["beat_housekeeping", "setup_healthcheck"]
+__all__ = ["beat_housekeeping", "setup_healthcheck", "register_stats", "collect_stats"]
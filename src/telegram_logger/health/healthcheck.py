@@ -1,15 +1,20 @@
+import hmac
 import json
 import logging
 import threading
 from datetime import datetime, timezone
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Optional
+from urllib.parse import parse_qs
 
+from telegram_logger.health import metrics, profiling
 from telegram_logger.health.beats import LAST_HOUSEKEEPING_AT
+from telegram_logger.health.stats import collect_stats
 from telegram_logger.settings import get_settings
 
 settings = get_settings()
 
+PROFILE_PREFIX = "/debug/profile/"
 STARTED_AT = datetime.now(timezone.utc)
 LAST_ERROR_AT: Optional[datetime] = None
 LAST_ERROR_MSG: Optional[str] = None
@@ -46,6 +51,7 @@ def _payload() -> dict:
         ),
         "last_error_at": LAST_ERROR_AT.isoformat() if LAST_ERROR_AT else None,
         "last_error_msg": LAST_ERROR_MSG,
+        "stats": collect_stats(),
     }
 
 
@@ -56,16 +62,62 @@ class _HealthHandler(BaseHTTPRequestHandler):
     def _serve(self):
         body = json.dumps(_payload()).encode("utf-8")
         code = 200 if _is_healthy(datetime.now(timezone.utc)) else 503
+        self._send_body(code, "application/json", body)
+
+    def _send_body(self, code: int, content_type: str, body: bytes):
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(body)))
         self.end_headers()
         if self.command != "HEAD":
             self.wfile.write(body)
 
+    def _serve_metrics(self):
+        self._send_body(200, metrics.CONTENT_TYPE, metrics.render().encode("utf-8"))
+
+    def _authorized(self) -> bool:
+        expected = f"Bearer {settings.profiling_token.get_secret_value()}"
+        received = self.headers.get("Authorization", "")
+        return hmac.compare_digest(received.encode(), expected.encode())
+
+    def _serve_profile(self, kind: str, query: dict):
+        if not self._authorized():
+            self.send_error(401, "Unauthorized")
+            return
+        fmt = query.get("format", [""])[0]
+        try:
+            if kind == "cpu":
+                seconds = min(
+                    float(query.get("seconds", ["10"])[0]), settings.profiling_max_seconds
+                )
+                content_type, body = profiling.cpu_profile(seconds, fmt or "collapsed")
+            elif kind == "memory":
+                content_type, body = profiling.memory_profile(
+                    limit=int(query.get("limit", ["50"])[0]),
+                    reset=query.get("reset", ["0"])[0] == "1",
+                    stop=query.get("stop", ["0"])[0] == "1",
+                    fmt=fmt or "text",
+                )
+            else:
+                self.send_error(404, "Not Found")
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except profiling.ProfilingError as e:
+            self.send_error(e.status, str(e))
+            return
+        self._send_body(200, content_type, body)
+
     def do_GET(self):
-        if self.path.split("?", 1)[0].rstrip("/") == settings.health_path.rstrip("/"):
+        path, _, query = self.path.partition("?")
+        path = path.rstrip("/")
+        if path == settings.health_path.rstrip("/"):
             self._serve()
+        elif settings.metrics_path and path == settings.metrics_path.rstrip("/"):
+            self._serve_metrics()
+        elif settings.profiling_token.get_secret_value() and path.startswith(PROFILE_PREFIX):
+            self._serve_profile(path.removeprefix(PROFILE_PREFIX), parse_qs(query))
         else:
             self.send_error(404, "Not Found")
 
@@ -85,3 +137,11 @@ def setup_healthcheck() -> None:
     logging.getLogger("health").info(
         "Health endpoint on 0.0.0.0:%s%s", settings.health_port, settings.health_path
     )
+    if settings.metrics_path:
+        logging.getLogger("health").info(
+            "Metrics endpoint on 0.0.0.0:%s%s", settings.health_port, settings.metrics_path
+        )
+    if settings.profiling_token.get_secret_value():
+        logging.getLogger("health").info(
+            "Profiling endpoints on 0.0.0.0:%s%s", settings.health_port, PROFILE_PREFIX
+        )
@@ -0,0 +1,215 @@
+"""Prometheus text-format metrics served at /metrics by the health server.
+
+Counters and histograms are updated from the event loop with plain dict and list
+operations, no locks and no formatting; everything is rendered at scrape time.
+Gauges are not kept here: every number in the registered stats providers (see
+health.stats) is exported as telegram_logger_<provider>_<key>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left
+from typing import Sequence
+
+from sqlalchemy import event
+
+from telegram_logger.health.stats import collect_stats
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "telegram_logger"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+SIZE_BUCKETS = tuple(4**n * 1024 for n in range(10))  # 1 KiB .. 256 GiB
+
+_METRICS: list[_Metric] = []
+_NAME_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _METRICS.append(self)
+
+    def render(self, lines: list[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, lines: list[str]) -> None:
+        super().render(lines)
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self, lines: list[str]) -> None:
+        super().render(lines)
+        for labels, counts in list(self._values.items()):
+            counts = list(counts)
+            total = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                total += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {total}")
+            label_str = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{label_str} {total}")
+
+
+EVENTS = Counter("events_total", "Telegram events handled.", ("handler", "event"))
+HANDLER_ERRORS = Counter(
+    "handler_errors_total", "Events whose handler raised.", ("handler", "event")
+)
+HANDLER_SECONDS = Histogram(
+    "handler_duration_seconds", "Time spent in an event handler.", ("handler",)
+)
+MESSAGES_SAVED = Counter("messages_saved_total", "Messages written to the database.")
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "SQLite statement execution time.",
+    ("statement",),
+    buckets=DB_BUCKETS,
+)
+MEDIA_DOWNLOAD_SECONDS = Histogram(
+    "media_download_duration_seconds", "Time to download media into the buffer."
+)
+MEDIA_DOWNLOAD_BYTES = Histogram(
+    "media_download_bytes", "Size of media downloaded into the buffer.", buckets=SIZE_BUCKETS
+)
+LOG_SEND_SECONDS = Histogram(
+    "log_send_duration_seconds",
+    "Duration of a message or upload to the log chat, excluding queueing.",
+    ("outcome",),
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a timer.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement the SQLAlchemy engine runs into DB_QUERY_SECONDS."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["metrics_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("metrics_started", None)
+        if started is not None:
+            kind = statement.split(None, 1)[0].upper() if statement else ""
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, kind)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.lag_max = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="event-loop-lag")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.monotonic() - started - self.interval)
+            self.lag_max = max(self.lag_max, self.lag)
+            EVENT_LOOP_LAG_SECONDS.observe(self.lag)
+
+    def stats(self) -> dict:
+        return {"lag_secs": round(self.lag, 4), "lag_max_secs": round(self.lag_max, 4)}
+
+
+def _render_stats(lines: list[str], name: str, value) -> None:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _render_stats(lines, f"{name}_{key}", item)
+        return
+    if isinstance(value, bool):
+        value = int(value)
+    elif not isinstance(value, (int, float)):
+        return
+    name = _NAME_UNSAFE.sub("_", name)
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {_number(value)}")
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _METRICS:
+        metric.render(lines)
+    _render_stats(lines, PREFIX, collect_stats())
+    return "\n".join(lines) + "\n"
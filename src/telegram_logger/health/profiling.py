@@ -0,0 +1,181 @@
+"""On-demand CPU and memory profiling of the running process.
+
+Served by the health server under /debug/profile/ when PROFILING_TOKEN is set;
+requests must send it as "Authorization: Bearer <token>".
+
+    cpu?seconds=10                  sampled stacks of the event loop thread, in the
+                                    collapsed format read by speedscope and flamegraph.pl
+    cpu?seconds=10&format=pstats    cProfile data of the event loop thread, for pstats
+                                    or snakeviz (pstats.Stats("file"))
+    memory                          tracemalloc top allocations diffed against a baseline;
+                                    the first call starts tracing and takes the baseline
+    memory?reset=1                  take a new baseline
+    memory?stop=1                   stop tracing (it slows allocations down)
+    memory?format=snapshot          tracemalloc.Snapshot.dump() data, for Snapshot.load()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 10
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_thread_id: int | None = None
+_cpu_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_baseline: tracemalloc.Snapshot | None = None
+
+
+class ProfilingError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def attach(loop: asyncio.AbstractEventLoop) -> None:
+    """Remember the event loop to profile; call from the loop's own thread."""
+    global _loop, _loop_thread_id
+    _loop = loop
+    _loop_thread_id = threading.get_ident()
+
+
+def format_task_stack(task: asyncio.Task) -> str:
+    """The task's await chain, outermost first, down to what it is waiting on."""
+    lines = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        code = frame.f_code
+        lines.append(f'  File "{code.co_filename}", line {frame.f_lineno}, in {code.co_name}')
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return "\n".join(lines)
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_stacks(seconds: float) -> bytes:
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(_loop_thread_id)
+        if frame is not None:
+            stacks[_collapse(frame)] += 1
+        del frame
+        time.sleep(SAMPLE_INTERVAL)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()).encode()
+
+
+def _profile_loop(seconds: float) -> bytes:
+    profiler = cProfile.Profile()
+    started = threading.Event()
+    stopped = threading.Event()
+    errors: list[Exception] = []
+
+    def _enable():
+        try:
+            profiler.enable()
+        except ValueError as e:  # another profiler is active
+            errors.append(e)
+        started.set()
+
+    def _disable():
+        profiler.disable()
+        stopped.set()
+
+    _loop.call_soon_threadsafe(_enable)
+    if not started.wait(seconds + 5):
+        raise ProfilingError(503, "Event loop did not respond")
+    if errors:
+        raise ProfilingError(409, str(errors[0]))
+    time.sleep(seconds)
+    _loop.call_soon_threadsafe(_disable)
+    if not stopped.wait(30):
+        raise ProfilingError(503, "Event loop did not respond")
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+def cpu_profile(seconds: float, fmt: str = "collapsed") -> tuple[str, bytes]:
+    if _loop is None:
+        raise ProfilingError(503, "Event loop not attached")
+    if fmt not in ("collapsed", "pstats"):
+        raise ProfilingError(400, f"Unknown format: {fmt}")
+    if not _cpu_lock.acquire(blocking=False):
+        raise ProfilingError(409, "A CPU profile is already running")
+    try:
+        logger.info("Capturing CPU profile seconds=%s format=%s", seconds, fmt)
+        if fmt == "pstats":
+            return "application/octet-stream", _profile_loop(seconds)
+        return "text/plain; charset=utf-8", _sample_stacks(seconds)
+    finally:
+        _cpu_lock.release()
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+    )
+
+
+def memory_profile(
+    limit: int = 50, reset: bool = False, stop: bool = False, fmt: str = "text"
+) -> tuple[str, bytes]:
+    global _baseline
+    if fmt not in ("text", "snapshot"):
+        raise ProfilingError(400, f"Unknown format: {fmt}")
+    with _memory_lock:
+        if stop:
+            tracemalloc.stop()
+            _baseline = None
+            return "text/plain; charset=utf-8", b"tracemalloc stopped\n"
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _baseline = None
+        snapshot = _snapshot()
+        if _baseline is None or reset:
+            _baseline = snapshot
+            logger.info("tracemalloc baseline taken")
+            return "text/plain; charset=utf-8", b"tracemalloc baseline taken\n"
+
+        if fmt == "snapshot":
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "snapshot")
+                snapshot.dump(path)
+                with open(path, "rb") as f:
+                    return "application/octet-stream", f.read()
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"traced_bytes={current} peak_bytes={peak}",
+            f"top {limit} allocation sites by growth since the baseline:",
+        ]
+        lines += [str(stat) for stat in snapshot.compare_to(_baseline, "lineno")[:limit]]
+        return "text/plain; charset=utf-8", ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,17 @@
+from typing import Callable
+
+_PROVIDERS: dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(name: str, provider: Callable[[], dict]) -> None:
+    _PROVIDERS[name] = provider
+
+
+def collect_stats() -> dict:
+    stats = {}
+    for name, provider in list(_PROVIDERS.items()):
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats
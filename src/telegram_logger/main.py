@@ -1,21 +1,37 @@
 import asyncio
 import logging
+import signal
+import time
 from datetime import datetime, timezone
 from typing import Awaitable, Callable
 
 from telethon import TelegramClient, events
 
-from telegram_logger.database import MessageRepository
+from telegram_logger.database import MessageRepository, SeenMessageIndex, engine
+from telegram_logger.entity_cache import EntityCache
 from telegram_logger.handlers.edited_deleted import edited_deleted_handler
 from telegram_logger.handlers.new_message import new_message_handler
+from telegram_logger.handlers.packing import DeletedTextPacker
 from telegram_logger.handlers.restricted_saver import (
     maybe_handle_restricted_link,
     save_restricted_msg,
 )
+from telegram_logger.health import profiling
 from telegram_logger.health.beats import beat_housekeeping
 from telegram_logger.health.healthcheck import setup_healthcheck
+from telegram_logger.health.metrics import (
+    EVENTS,
+    HANDLER_ERRORS,
+    HANDLER_SECONDS,
+    LoopLagMonitor,
+    instrument_engine,
+)
+from telegram_logger.health.stats import register_stats
+from telegram_logger.outbound import OutboundDispatcher
 from telegram_logger.settings import get_settings
+from telegram_logger.storage.downloads import DownloadScheduler
 from telegram_logger.storage.encrypted_deleted import EncryptedDeletedStorage
+from telegram_logger.storage.executor import StorageExecutor
 from telegram_logger.storage.plaintext import PlaintextBufferStorage
 
 settings = get_settings()
@@ -28,24 +44,87 @@ logging.getLogger("telethon").setLevel(logging.WARNING)
 logging.getLogger("asyncio").setLevel(logging.WARNING)
 
 
+def _log_slow_handler(name: str, event_type: str, threshold_ms: int, task: asyncio.Task):
+    logger.warning(
+        "Handler still running after %sms handler=%s event=%s, waiting at:\n%s",
+        threshold_ms,
+        name,
+        event_type,
+        profiling.format_task_stack(task),
+    )
+
+
 def _safe_event_handler(
-    name: str, handler: Callable[[object], Awaitable[None]]
+    name: str,
+    handler: Callable[[object], Awaitable[None]],
+    slow_threshold_ms: int | None = None,
 ) -> Callable[[object], Awaitable[None]]:
+    if slow_threshold_ms is None:
+        slow_threshold_ms = settings.slow_handler_threshold_ms
+
     async def _wrapped(event):
+        event_type = type(event).__name__
+        EVENTS.inc(name, event_type)
+        watchdog = None
+        if slow_threshold_ms > 0:
+            # fires while the handler is suspended, so the stack shows what it awaits
+            watchdog = asyncio.get_running_loop().call_later(
+                slow_threshold_ms / 1000,
+                _log_slow_handler,
+                name,
+                event_type,
+                slow_threshold_ms,
+                asyncio.current_task(),
+            )
+        started = time.perf_counter()
         try:
             await handler(event)
         except asyncio.CancelledError:
             raise
         except Exception:
+            HANDLER_ERRORS.inc(name, event_type)
             logger.exception(
                 "Unhandled exception in handler=%s event=%s",
                 name,
-                type(event).__name__,
+                event_type,
             )
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_SECONDS.observe(elapsed, name)
+            if watchdog is not None:
+                watchdog.cancel()
+                if elapsed * 1000 >= slow_threshold_ms:
+                    logger.warning(
+                        "Slow handler=%s event=%s took_ms=%.1f",
+                        name,
+                        event_type,
+                        elapsed * 1000,
+                    )
 
     return _wrapped
 
 
+def install_shutdown_handlers(task: asyncio.Task) -> asyncio.Event:
+    """Cancel task on SIGTERM or SIGINT, so run() drains its queues in its finally block.
+
+    Returns an event that is set once a shutdown signal arrived.
+    """
+    loop = asyncio.get_running_loop()
+    requested = asyncio.Event()
+
+    def _shutdown(sig: signal.Signals) -> None:
+        if requested.is_set():
+            logger.warning("Received %s again, still draining", sig.name)
+            return
+        logger.info("Received %s, shutting down", sig.name)
+        requested.set()
+        task.cancel()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, _shutdown, sig)
+    return requested
+
+
 def utcnow():
     return datetime.now(timezone.utc)
 
@@ -58,13 +137,24 @@ async def housekeeping_loop(
         now = utcnow()
         logger.debug("Running housekeeping tick at %s", now.isoformat())
         try:
-            await db.delete_expired_messages(now)
+            await db.delete_expired_messages(
+                now,
+                chunk_size=settings.retention_chunk_size,
+                time_budget=settings.retention_time_budget_secs,
+            )
         except Exception:
             logger.exception("delete_expired_messages failed")
         try:
             await buffer_storage.purge_buffer_ttl(now, ttl_hours=ttl_hours)
         except Exception:
             logger.exception("purge_buffer_ttl failed")
+        try:
+            await db.migrate_legacy_media(
+                batch_size=settings.media_migration_batch_size,
+                time_budget=settings.media_migration_time_budget_secs,
+            )
+        except Exception:
+            logger.exception("migrate_legacy_media failed")
         logger.info("Housekeeping finished")
         await asyncio.sleep(300)
 
@@ -77,20 +167,91 @@ async def run(client: TelegramClient):
     )
     logger.info("Starting telegram-logger with debug_mode=%s", settings.debug_mode)
     setup_healthcheck()
+    profiling.attach(asyncio.get_running_loop())
+    loop_lag = LoopLagMonitor()
+    loop_lag.start()
+    register_stats("event_loop", loop_lag.stats)
 
     me = await client.get_me()
     logger.debug("Authenticated as user id=%s", getattr(me, "id", None))
     my_id = me.id
 
-    db = MessageRepository(settings.build_sqlite_url())
+    db = MessageRepository(
+        settings.build_sqlite_url(),
+        write_behind=settings.db_write_behind,
+        batch_size=settings.db_write_batch_size,
+        flush_interval=settings.db_write_flush_interval_secs,
+        max_pending=settings.db_write_max_pending,
+        seen_index=(
+            SeenMessageIndex(
+                expected_messages=settings.seen_index_expected_messages,
+                recent_size=settings.seen_index_recent_size,
+                error_rate=settings.seen_index_error_rate,
+            )
+            if settings.seen_index_enabled
+            else None
+        ),
+        verify_query_plans=settings.debug_mode,
+        partition_by_day=settings.db_partition_by_day,
+    )
+    instrument_engine(engine.sync_engine)
     await db.init()
+    register_stats("database", db.stats)
     logger.info("Database initialized at %s", settings.sqlite_db_file)
 
+    entity_cache = EntityCache(
+        client,
+        ttl=settings.entity_cache_ttl_secs,
+        negative_ttl=settings.entity_cache_negative_ttl_secs,
+        max_size=settings.entity_cache_max_size,
+    )
+    register_stats("entity_cache", entity_cache.stats)
+
+    storage_io = StorageExecutor(
+        max_workers=settings.storage_io_threads,
+        debug=settings.debug_mode,
+        warn_after_ms=settings.storage_block_warn_ms,
+    )
+    storage_io.start_watchdog(asyncio.get_running_loop())
+
     buffer_storage = PlaintextBufferStorage(
         client=client,
         media_dir=settings.media_dir,
         max_buffer_size=settings.max_buffer_file_size,
+        entity_cache=entity_cache,
+        purge_time_budget=settings.media_buffer_purge_time_budget_secs,
+        io=storage_io,
+        max_total_size=settings.max_media_buffer_size,
+        eviction_weights=settings.media_buffer_eviction_weights,
+        dedupe=settings.media_buffer_dedupe,
+    )
+    await buffer_storage.rebuild_index()
+    register_stats("media_buffer", buffer_storage.stats)
+
+    downloads = DownloadScheduler(
+        buffer_storage,
+        workers=settings.media_download_workers,
+        max_queue=settings.media_download_queue_limit,
+    )
+    downloads.start()
+    register_stats("media_downloads", downloads.stats)
+
+    outbound = OutboundDispatcher(
+        client,
+        rate=settings.log_send_rate_per_sec,
+        burst=settings.log_send_burst,
+        workers=settings.log_send_workers,
+        max_flood_retries=settings.log_send_max_flood_retries,
     )
+    outbound.start()
+    register_stats("outbound", outbound.stats)
+
+    text_packer = None
+    if settings.pack_deleted_text_messages:
+        text_packer = DeletedTextPacker(
+            outbound, settings.log_chat_id, window=settings.pack_deleted_text_window_secs
+        )
+        register_stats("deleted_text_packer", text_packer.stats)
 
     deleted_storage = None
     if (
@@ -100,6 +261,7 @@ async def run(client: TelegramClient):
         deleted_storage = EncryptedDeletedStorage(
             deleted_dir=settings.media_deleted_dir,
             key_b64=settings.deleted_media_key_b64.get_secret_value(),
+            io=storage_io,
         )
         logger.info("Encrypted deleted media storage is enabled")
 
@@ -114,13 +276,24 @@ async def run(client: TelegramClient):
             settings,
             my_id,
             lambda link: save_restricted_msg(
-                link, client, buffer_storage, settings.log_chat_id
+                link, client, buffer_storage, settings.log_chat_id, outbound=outbound
             ),
+            downloads=downloads,
         )
 
     async def _on_edited_or_deleted(e):
         await edited_deleted_handler(
-            e, client, db, buffer_storage, deleted_storage, settings, my_id
+            e,
+            client,
+            db,
+            buffer_storage,
+            deleted_storage,
+            settings,
+            my_id,
+            entity_cache=entity_cache,
+            downloads=downloads,
+            outbound=outbound,
+            text_packer=text_packer,
         )
 
     client.add_event_handler(
@@ -160,7 +333,7 @@ async def run(client: TelegramClient):
                 settings,
                 my_id,
                 lambda link: save_restricted_msg(
-                    link, client, buffer_storage, settings.log_chat_id
+                    link, client, buffer_storage, settings.log_chat_id, outbound=outbound
                 ),
             )
 
@@ -175,4 +348,14 @@ async def run(client: TelegramClient):
         "Housekeeping loop started with media_buffer_ttl_hours=%s",
         settings.media_buffer_ttl_hours,
     )
-    await housekeeping_loop(db, buffer_storage, settings.media_buffer_ttl_hours)
+    try:
+        await housekeeping_loop(db, buffer_storage, settings.media_buffer_ttl_hours)
+    finally:
+        await downloads.close()
+        if text_packer is not None:
+            await text_packer.close()
+        await outbound.close()
+        await db.close()
+        logger.info("Database writes drained")
+        storage_io.shutdown()
+        await loop_lag.close()
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Hashable
+
+from telethon.errors import FloodWaitError
+
+from telegram_logger.health.metrics import LOG_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SendFn = Callable[[], Awaitable]
+
+
+@dataclass(slots=True)
+class _Send:
+    source: Hashable
+    fn: SendFn
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    flood_retries: int = 0
+
+
+class DirectSender:
+    """Sends immediately; used when no dispatcher is configured."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def call(self, source_chat_id: Hashable, fn: SendFn):
+        return await fn()
+
+    async def send_message(self, source_chat_id: Hashable, *args, **kwargs):
+        return await self.client.send_message(*args, **kwargs)
+
+    async def send_file(self, source_chat_id: Hashable, *args, **kwargs):
+        return await self.client.send_file(*args, **kwargs)
+
+    async def wait_for_room(self, max_backlog: int) -> None:
+        return None
+
+
+class OutboundDispatcher:
+    """Paces log-chat sends with a token bucket.
+
+    Sends are queued per source chat and served round-robin, so one busy chat cannot
+    starve the others while each chat keeps its own order (a chat is never served by
+    two workers at once). A FloodWaitError pauses the bucket for the requested time
+    and puts the send back at the head of its chat queue; the send callable is invoked
+    again, so it must be safe to repeat (open streams inside it, not before).
+    """
+
+    def __init__(
+        self,
+        client,
+        rate: float = 0.5,
+        burst: int = 10,
+        workers: int = 2,
+        max_flood_retries: int = 5,
+    ):
+        self.client = client
+        self.rate = max(rate, 1e-3)
+        self.burst = max(1, burst)
+        self.workers = max(1, workers)
+        self.max_flood_retries = max_flood_retries
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._bucket_lock = asyncio.Lock()
+        self._queues: dict[Hashable, deque[_Send]] = {}
+        self._ready: deque[Hashable] = deque()
+        self._busy: set[Hashable] = set()
+        self._wakeup = asyncio.Event()
+        self._dequeued = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.flood_wait_secs = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.call_total = 0.0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"outbound-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(
+            "Outbound dispatcher started rate=%s/s burst=%s workers=%s",
+            self.rate,
+            self.burst,
+            self.workers,
+        )
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._queues.values():
+            while queue:
+                queue.popleft().future.cancel()
+        self._queues.clear()
+        self._ready.clear()
+        self._dequeued.set()
+
+    @property
+    def backlog(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict:
+        done = self.sent + self.failed
+        return {
+            "backlog": self.backlog,
+            "chats_waiting": len(self._ready),
+            "in_flight": len(self._busy),
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "flood_wait_secs": self.flood_wait_secs,
+            "paused_for_secs": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "latency_avg_secs": round(self.latency_total / done, 3) if done else 0.0,
+            "latency_max_secs": round(self.latency_max, 3),
+            "call_avg_secs": round(self.call_total / done, 3) if done else 0.0,
+        }
+
+    def submit(self, source_chat_id: Hashable, fn: SendFn) -> asyncio.Future:
+        send = _Send(source_chat_id, fn, asyncio.get_running_loop().create_future())
+        self._enqueue(send)
+        return send.future
+
+    async def call(self, source_chat_id: Hashable, fn: SendFn):
+        return await self.submit(source_chat_id, fn)
+
+    async def send_message(self, source_chat_id: Hashable, *args, **kwargs):
+        return await self.call(
+            source_chat_id, lambda: self.client.send_message(*args, **kwargs)
+        )
+
+    async def send_file(self, source_chat_id: Hashable, *args, **kwargs):
+        return await self.call(source_chat_id, lambda: self.client.send_file(*args, **kwargs))
+
+    async def wait_for_room(self, max_backlog: int) -> None:
+        """Wait until at most max_backlog sends are queued; producers call it to slow down."""
+        while self._tasks and self.backlog > max_backlog:
+            self._dequeued.clear()
+            await self._dequeued.wait()
+
+    def _enqueue(self, send: _Send) -> None:
+        self._queues.setdefault(send.source, deque()).append(send)
+        if send.source not in self._busy and send.source not in self._ready:
+            self._ready.append(send.source)
+        self._wakeup.set()
+
+    def _next(self) -> _Send | None:
+        while self._ready:
+            source = self._ready.popleft()
+            queue = self._queues.get(source)
+            if not queue:
+                self._queues.pop(source, None)
+                continue
+            self._busy.add(source)
+            self._dequeued.set()
+            return queue.popleft()
+        return None
+
+    def _release(self, source: Hashable) -> None:
+        self._busy.discard(source)
+        if self._queues.get(source):
+            self._ready.append(source)
+            self._wakeup.set()
+        else:
+            self._queues.pop(source, None)
+
+    async def _acquire(self) -> None:
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._refilled_at) * self.rate
+                )
+                self._refilled_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _worker(self) -> None:
+        while True:
+            send = self._next()
+            if send is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if send.future.cancelled():
+                self._release(send.source)
+                continue
+
+            retry = False
+            started = time.monotonic()
+            try:
+                await self._acquire()
+                started = time.monotonic()
+                result = await send.fn()
+            except asyncio.CancelledError:
+                send.future.cancel()
+                raise
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                self.flood_wait_secs += e.seconds
+                self._paused_until = max(self._paused_until, time.monotonic() + e.seconds)
+                send.flood_retries += 1
+                retry = send.flood_retries <= self.max_flood_retries
+                logger.warning(
+                    "Flood wait on log chat send source=%s seconds=%s retry=%s",
+                    send.source,
+                    e.seconds,
+                    retry,
+                )
+                if not retry:
+                    self._finish(send, started, error=e)
+            except Exception as e:
+                self._finish(send, started, error=e)
+            else:
+                self._finish(send, started, result=result)
+            finally:
+                if retry:
+                    # keep the chat's order: the send goes back in front of its queue
+                    self._queues.setdefault(send.source, deque()).appendleft(send)
+                self._release(send.source)
+
+    def _finish(self, send: _Send, started: float, result=None, error=None) -> None:
+        now = time.monotonic()
+        latency = now - send.enqueued_at
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.call_total += now - started
+        LOG_SEND_SECONDS.observe(now - started, "ok" if error is None else "error")
+        if error is None:
+            self.sent += 1
+            if not send.future.done():
+                send.future.set_result(result)
+        else:
+            self.failed += 1
+            if not send.future.done():
+                send.future.set_exception(error)
@@ -20,11 +20,50 @@ class Settings(BaseSettings):
     process_self_destruct_media: bool = False
     max_buffer_file_size: int = 100 * 1024 * 1024
     media_buffer_ttl_hours: int = 24
+    media_buffer_purge_time_budget_secs: float = 2.0
+    max_media_buffer_size: int = 0
+    media_buffer_eviction_weights: dict[str, float] = Field(
+        default_factory=lambda: {"self_destruct": 8.0, "noforwards": 4.0, "bulk": 1.0}
+    )
+    media_buffer_dedupe: bool = True
+    media_download_workers: int = 3
+    media_download_queue_limit: int = 1000
+
+    storage_io_threads: int = 4
+    storage_block_warn_ms: int = 100
 
     encrypt_deleted_media: bool = False
     deleted_media_key_b64: SecretStr = SecretStr("")
 
-    max_deleted_messages_per_event: int = 100
+    max_deleted_messages_per_event: int = 0
+    deleted_lookup_chunk_size: int = 500
+    deleted_send_backlog_limit: int = 100
+    pack_deleted_text_messages: bool = True
+    pack_deleted_text_window_secs: float = 0.0
+    group_deleted_albums: bool = True
+
+    log_send_rate_per_sec: float = 0.5
+    log_send_burst: int = 10
+    log_send_workers: int = 2
+    log_send_max_flood_retries: int = 5
+
+    media_migration_batch_size: int = 500
+    media_migration_time_budget_secs: float = 1.0
+
+    db_write_behind: bool = False
+    db_write_batch_size: int = 500
+    db_write_flush_interval_secs: float = 1.0
+    db_write_max_pending: int = 10000
+    db_partition_by_day: bool = False
+
+    seen_index_enabled: bool = True
+    seen_index_expected_messages: int = 1_000_000
+    seen_index_recent_size: int = 100_000
+    seen_index_error_rate: float = 0.01
+
+    entity_cache_ttl_secs: int = 900
+    entity_cache_negative_ttl_secs: int = 120
+    entity_cache_max_size: int = 10000
 
     save_deleted_from_private_chats: bool = True
     save_deleted_from_groups: bool = True
@@ -38,11 +77,17 @@ class Settings(BaseSettings):
     persist_time_in_days_user: int = 7
     persist_time_in_days_channel: int = 7
     persist_time_in_days_group: int = 7
+    retention_chunk_size: int = 1000
+    retention_time_budget_secs: float = 1.0
 
     health_path: str = "/health"
     health_port: int = 8080
     health_error_window_secs: int = 120
     health_housekeeping_stale_secs: int = 600
+    metrics_path: str = "/metrics"
+    profiling_token: SecretStr = SecretStr("")
+    profiling_max_seconds: float = 60.0
+    slow_handler_threshold_ms: int = 0
 
     debug_mode: bool = False
 
@@ -2,26 +2,49 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
-from typing import BinaryIO, Optional, Protocol
+from typing import AsyncContextManager, Optional, Protocol
 
 
 class MediaStorage(Protocol):
-    async def buffer_save(self, message) -> Optional[str]:
+    async def buffer_save(self, message, reason: str = "bulk") -> Optional[str]:
         pass
 
     def buffer_find(self, msg_id: int, chat_id: int) -> Optional[str]:
         pass
 
+    async def buffer_remove(self, path: str) -> None:
+        pass
+
     async def deleted_put_from_buffer(self, src_path: str) -> Optional[str]:
         pass
 
-    def deleted_open_for_upload(self, enc_path: str) -> BinaryIO:
+    def deleted_open_for_upload(
+        self, enc_path: str, name: Optional[str] = None
+    ) -> AsyncContextManager:
         pass
 
-    async def purge_buffer_ttl(self, now: datetime) -> None:
+    async def purge_buffer_ttl(self, now: datetime) -> Optional[PurgeResult]:
         pass
 
 
+@dataclass(slots=True)
+class BufferedFile:
+    path: str
+    size: int
+    # when this path was buffered; TTL and eviction age count from it
+    mtime: float
+    weight: float = 1.0
+    # inode shared by hardlinked copies of the same media, 0 when unknown
+    inode: int = 0
+
+
+@dataclass(slots=True)
+class PurgeResult:
+    files: int = 0
+    bytes: int = 0
+    complete: bool = True
+
+
 @dataclass(frozen=True)
 class StoredDeletedMedia:
     enc_path: str
@@ -0,0 +1,119 @@
+"""Chunked AES-GCM file format for deleted media.
+
+Layout: MAGIC | version (1) | chunk_size (4, BE) | nonce_prefix (7) followed by
+AES-GCM segments of chunk_size plaintext bytes (the last one may be shorter or empty),
+each with its own 16-byte tag. The nonce of segment i is nonce_prefix | i (4, BE) |
+last flag (1) and the header is authenticated with every segment, so reordering,
+truncation and appended data all fail to decrypt.
+
+Files written before this format are a single nonce (12) | ciphertext+tag blob;
+readers detect them by the missing MAGIC.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+from typing import BinaryIO, Iterator
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+MAGIC = b"TLGENC"
+VERSION = 2
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+LEGACY_NONCE_SIZE = 12
+
+_HEADER = struct.Struct(f">{len(MAGIC)}sBI{NONCE_PREFIX_SIZE}s")
+HEADER_SIZE = _HEADER.size
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+
+def _read_exact(src: BinaryIO, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        part = src.read(size - len(buf))
+        if not part:
+            break
+        buf += part
+    return bytes(buf)
+
+
+def encrypt_stream(
+    aes: AESGCM, src: BinaryIO, dst: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """Encrypt src into dst, returning the number of plaintext bytes."""
+    prefix = os.urandom(NONCE_PREFIX_SIZE)
+    header = _HEADER.pack(MAGIC, VERSION, chunk_size, prefix)
+    dst.write(header)
+
+    total = 0
+    index = 0
+    chunk = _read_exact(src, chunk_size)
+    while True:
+        following = _read_exact(src, chunk_size) if len(chunk) == chunk_size else b""
+        last = not following
+        dst.write(aes.encrypt(_nonce(prefix, index, last), chunk, header))
+        total += len(chunk)
+        if last:
+            return total
+        if index == 0xFFFFFFFF:
+            raise ValueError("File is too large for the chunked format")
+        index += 1
+        chunk = following
+
+
+def read_header(src: BinaryIO) -> tuple[bytes, int, bytes] | None:
+    """Return (header, chunk_size, nonce_prefix) or None for a legacy blob."""
+    header = _read_exact(src, HEADER_SIZE)
+    if len(header) == HEADER_SIZE:
+        magic, version, chunk_size, prefix = _HEADER.unpack(header)
+        if magic == MAGIC:
+            if version != VERSION:
+                raise ValueError(f"Unsupported encrypted file version: {version}")
+            if chunk_size <= 0:
+                raise ValueError("Invalid chunk size in encrypted file header")
+            return header, chunk_size, prefix
+    src.seek(0)
+    return None
+
+
+def iter_decrypt(aes: AESGCM, src: BinaryIO) -> Iterator[bytes]:
+    """Yield plaintext chunks of a chunked or legacy single-shot encrypted file."""
+    parsed = read_header(src)
+    if parsed is None:
+        blob = src.read()
+        if len(blob) < LEGACY_NONCE_SIZE + 1:
+            raise ValueError("Encrypted file is too short")
+        yield aes.decrypt(blob[:LEGACY_NONCE_SIZE], blob[LEGACY_NONCE_SIZE:], None)
+        return
+
+    header, chunk_size, prefix = parsed
+    segment_size = chunk_size + TAG_SIZE
+    index = 0
+    segment = _read_exact(src, segment_size)
+    while True:
+        if len(segment) < TAG_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        following = _read_exact(src, segment_size) if len(segment) == segment_size else b""
+        last = not following
+        yield aes.decrypt(_nonce(prefix, index, last), segment, header)
+        if last:
+            return
+        index += 1
+        segment = following
+
+
+def plaintext_size(src: BinaryIO, file_size: int) -> int | None:
+    """Plaintext length of a chunked file from its size, None for legacy blobs."""
+    parsed = read_header(src)
+    if parsed is None:
+        return None
+    _, chunk_size, _ = parsed
+    body = file_size - HEADER_SIZE
+    segments = max(1, -(-body // (chunk_size + TAG_SIZE)))
+    return body - segments * TAG_SIZE
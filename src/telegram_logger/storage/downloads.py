@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadPriority(IntEnum):
+    SELF_DESTRUCT = 0
+    NOFORWARDS = 1
+    BULK = 2
+
+
+@dataclass(slots=True)
+class _Job:
+    key: tuple[int, int]
+    message: object
+    priority: DownloadPriority
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class DownloadScheduler:
+    """Buffers media on a fixed number of workers, most urgent lane first.
+
+    Jobs are deduplicated per (chat_id, msg_id). When more than max_queue jobs are
+    waiting, the newest job of the least urgent lane is shed (its future resolves to
+    None), unless the incoming job is not more urgent than anything queued.
+    """
+
+    def __init__(self, buffer_storage, workers: int = 3, max_queue: int = 1000):
+        self.buffer_storage = buffer_storage
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._lanes: dict[DownloadPriority, deque[_Job]] = {
+            priority: deque() for priority in DownloadPriority
+        }
+        self._jobs: dict[tuple[int, int], _Job] = {}
+        self._in_flight = 0
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+        self.completed = 0
+        self.failed = 0
+        self.shed = 0
+        self.deduped = 0
+        self.expedited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"media-download-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(
+            "Media download workers started workers=%s max_queue=%s",
+            self.workers,
+            self.max_queue,
+        )
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for lane in self._lanes.values():
+            while lane:
+                job = lane.popleft()
+                self._jobs.pop(job.key, None)
+                job.future.cancel()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def stats(self) -> dict:
+        return {
+            "queued": {priority.name.lower(): len(lane) for priority, lane in self._lanes.items()},
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "shed": self.shed,
+            "deduped": self.deduped,
+            "expedited": self.expedited,
+            "time_to_buffer_avg_secs": (
+                round(self.wait_total / self.completed, 3) if self.completed else 0.0
+            ),
+            "time_to_buffer_max_secs": round(self.wait_max, 3),
+        }
+
+    def _shed_one(self, below: DownloadPriority) -> bool:
+        for priority in sorted(DownloadPriority, reverse=True):
+            if priority <= below:
+                return False
+            lane = self._lanes[priority]
+            if lane:
+                job = lane.pop()
+                self._jobs.pop(job.key, None)
+                job.future.set_result(None)
+                self.shed += 1
+                logger.info(
+                    "Shed queued media download chat_id=%s msg_id=%s priority=%s",
+                    job.key[0],
+                    job.key[1],
+                    job.priority.name,
+                )
+                return True
+        return False
+
+    def submit(self, message, priority: DownloadPriority) -> Optional[asyncio.Future]:
+        key = (message.chat_id or 0, message.id)
+        job = self._jobs.get(key)
+        if job is not None:
+            self.deduped += 1
+            if priority < job.priority and job in self._lanes[job.priority]:
+                self._lanes[job.priority].remove(job)
+                job.priority = priority
+                self._lanes[priority].append(job)
+            return job.future
+
+        if self.queued >= self.max_queue and not self._shed_one(priority):
+            self.shed += 1
+            logger.info(
+                "Media download queue full, dropping chat_id=%s msg_id=%s priority=%s",
+                key[0],
+                key[1],
+                priority.name,
+            )
+            return None
+
+        job = _Job(key, message, priority, asyncio.get_running_loop().create_future())
+        self._jobs[key] = job
+        self._lanes[priority].append(job)
+        self._wakeup.set()
+        return job.future
+
+    async def wait_for(self, chat_id: int, msg_id: int) -> Optional[str]:
+        """Wait for a queued or running download of this message, if there is one.
+
+        A queued job is moved to the head of the most urgent lane: someone is blocked
+        on it now, whatever lane it was submitted to.
+        """
+        job = self._jobs.get((chat_id, msg_id))
+        if job is None:
+            return None
+        urgent = self._lanes[DownloadPriority.SELF_DESTRUCT]
+        lane = self._lanes[job.priority]
+        if job in lane and not (urgent and urgent[0] is job):
+            lane.remove(job)
+            urgent.appendleft(job)
+            self.expedited += 1
+        return await asyncio.shield(job.future)
+
+    def _next_job(self) -> Optional[_Job]:
+        for priority in DownloadPriority:
+            lane = self._lanes[priority]
+            if lane:
+                return lane.popleft()
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._in_flight += 1
+            try:
+                path = await self.buffer_storage.buffer_save(
+                    job.message, reason=job.priority.name.lower()
+                )
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception(
+                    "Media download failed chat_id=%s msg_id=%s", job.key[0], job.key[1]
+                )
+                if not job.future.done():
+                    job.future.set_result(None)
+                continue
+            finally:
+                self._in_flight -= 1
+                self._jobs.pop(job.key, None)
+
+            waited = time.monotonic() - job.enqueued_at
+            self.completed += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if not job.future.done():
+                job.future.set_result(path)
+            logger.debug(
+                "Buffered media chat_id=%s msg_id=%s priority=%s time_to_buffer=%.2fs",
+                job.key[0],
+                job.key[1],
+                job.priority.name,
+                waited,
+            )
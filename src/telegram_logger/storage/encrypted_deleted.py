@@ -1,15 +1,93 @@
 import base64
 import os
-import tempfile
-from contextlib import contextmanager
-from typing import BinaryIO, Iterator, Optional
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Optional
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+from telegram_logger.storage.chunked_aead import (
+    DEFAULT_CHUNK_SIZE,
+    LEGACY_NONCE_SIZE,
+    TAG_SIZE,
+    encrypt_stream,
+    iter_decrypt,
+    plaintext_size,
+)
+from telegram_logger.storage.executor import StorageExecutor
+
+
+class DecryptingReader:
+    """Async file-like object that decrypts an .enc file while it is being read.
+
+    Telethon awaits read() when it returns a coroutine, so every chunk is decrypted on
+    the storage pool and at most one chunk of plaintext is held in memory. The size must
+    be passed to send_file/upload_file as file_size because the stream is not seekable.
+    """
+
+    def __init__(self, aes: AESGCM, enc_path: str, io: StorageExecutor, name: str):
+        self.aes = aes
+        self.enc_path = enc_path
+        self.io = io
+        self.name = name
+        self.size = 0
+        self._src = None
+        self._chunks = None
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _open(self) -> None:
+        # the reader owns the handle until close(), so no with-block
+        self._src = open(self.enc_path, "rb")  # noqa: SIM115
+        try:
+            size = plaintext_size(self._src, os.fstat(self._src.fileno()).st_size)
+            if size is None:
+                size = os.fstat(self._src.fileno()).st_size - LEGACY_NONCE_SIZE - TAG_SIZE
+            self.size = max(0, size)
+            self._src.seek(0)
+            self._chunks = iter_decrypt(self.aes, self._src)
+        except BaseException:
+            self._src.close()
+            raise
+
+    async def open(self) -> "DecryptingReader":
+        await self.io.run(self._open)
+        return self
+
+    def seekable(self) -> bool:
+        return False
+
+    async def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = await self.io.run(next, self._chunks, None)
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    async def close(self) -> None:
+        if self._src is not None:
+            await self.io.run(self._src.close)
+            self._src = None
+
 
 class EncryptedDeletedStorage:
-    def __init__(self, deleted_dir: str, key_b64: str):
+    def __init__(
+        self,
+        deleted_dir: str,
+        key_b64: str,
+        io: Optional[StorageExecutor] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
         self.deleted_dir = deleted_dir
+        self.chunk_size = chunk_size
+        self.io = io or StorageExecutor()
         self.key = base64.b64decode(key_b64)
         if len(self.key) != 32:
             raise ValueError(
@@ -20,44 +98,50 @@ class EncryptedDeletedStorage:
     def buffer_find(self, msg_id: int, chat_id: int) -> Optional[str]:
         return None
 
-    async def buffer_save(self, message) -> Optional[str]:
+    async def buffer_save(self, message, reason: str = "bulk") -> Optional[str]:
+        return None
+
+    async def buffer_remove(self, path: str) -> None:
         return None
 
     async def purge_buffer_ttl(self, now):
         return None
 
-    async def deleted_put_from_buffer(self, src_path: str) -> Optional[str]:
-        os.makedirs(self.deleted_dir, exist_ok=True)
+    def _enc_path_for(self, src_path: str) -> str:
         base = os.path.basename(src_path)
-        enc_path = os.path.join(self.deleted_dir, base + ".enc")
+        shard = os.path.basename(os.path.dirname(src_path))
+        if shard.lstrip("-").isdigit():
+            # sharded buffer layout: keep the flat "{chat_id}_{msg_id}_{name}" name
+            base = f"{shard}_{base}"
+        return os.path.join(self.deleted_dir, base + ".enc")
 
+    def _encrypt_file(self, src_path: str, enc_path: str) -> str:
+        os.makedirs(self.deleted_dir, exist_ok=True)
         if os.path.exists(enc_path):
             return enc_path
 
-        with open(src_path, "rb") as f:
-            data = f.read()
-
-        nonce = os.urandom(12)
-        ct = self.aes.encrypt(nonce, data, None)
-
-        with open(enc_path, "wb") as f:
-            f.write(nonce + ct)
+        part_path = enc_path + ".part"
+        try:
+            with open(src_path, "rb") as src, open(part_path, "wb") as dst:
+                encrypt_stream(self.aes, src, dst, self.chunk_size)
+            os.replace(part_path, enc_path)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(part_path)
+            raise
 
         return enc_path
 
-    @contextmanager
-    def deleted_open_for_upload(self, enc_path: str) -> Iterator[BinaryIO]:
-        with open(enc_path, "rb") as f:
-            blob = f.read()
-
-        if len(blob) < 13:
-            raise ValueError(f"Encrypted file is too short: {enc_path}")
-
-        nonce, ct = blob[:12], blob[12:]
-        data = self.aes.decrypt(nonce, ct, None)
-
-        with tempfile.NamedTemporaryFile("w+b", delete=True) as tmp:
-            tmp.write(data)
-            tmp.flush()
-            tmp.seek(0)
-            yield tmp
+    async def deleted_put_from_buffer(self, src_path: str) -> Optional[str]:
+        return await self.io.run(self._encrypt_file, src_path, self._enc_path_for(src_path))
+
+    @asynccontextmanager
+    async def deleted_open_for_upload(
+        self, enc_path: str, name: Optional[str] = None
+    ) -> AsyncIterator[DecryptingReader]:
+        name = name or os.path.basename(enc_path).removesuffix(".enc")
+        reader = await DecryptingReader(self.aes, enc_path, self.io, name).open()
+        try:
+            yield reader
+        finally:
+            await reader.close()
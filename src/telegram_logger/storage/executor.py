@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_STORAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _describe_frame(frame) -> str:
+    if frame is None:
+        return "unknown"
+    stack = traceback.extract_stack(frame)
+    for entry in reversed(stack):
+        if entry.filename.startswith(_STORAGE_DIR):
+            return f"{os.path.basename(entry.filename)}:{entry.name}:{entry.lineno}"
+    last = stack[-1]
+    return f"{last.filename}:{last.name}:{last.lineno}"
+
+
+class StorageExecutor:
+    """Bounded thread pool for blocking storage I/O.
+
+    In debug mode a watchdog thread pings the event loop and logs which storage call
+    (or, failing that, which frame) kept it from responding, and for how long.
+    """
+
+    def __init__(self, max_workers: int = 4, debug: bool = False, warn_after_ms: int = 100):
+        self.max_workers = max(1, max_workers)
+        self.debug = debug
+        self.warn_after = warn_after_ms / 1000
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="storage-io"
+        )
+        self._on_loop_call: Optional[str] = None
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog_stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, partial(fn, *args, **kwargs))
+
+    @contextmanager
+    def on_loop(self, name: str):
+        """Mark a storage section that still runs on the event loop thread."""
+        if not self.debug:
+            yield
+            return
+        self._on_loop_call = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._on_loop_call = None
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.warn_after:
+                logger.warning(
+                    "Storage call %s blocked the event loop for %.1f ms",
+                    name,
+                    elapsed * 1000,
+                )
+
+    def start_watchdog(self, loop: asyncio.AbstractEventLoop) -> None:
+        if not self.debug or self._watchdog is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._watchdog = threading.Thread(
+            target=self._watch, args=(loop,), daemon=True, name="storage-loop-watchdog"
+        )
+        self._watchdog.start()
+        logger.info(
+            "Event loop block detector started threshold_ms=%.0f", self.warn_after * 1000
+        )
+
+    def _watch(self, loop: asyncio.AbstractEventLoop) -> None:
+        interval = max(self.warn_after, 0.05)
+        while not self._watchdog_stop.wait(interval):
+            pong = threading.Event()
+            started = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                return
+            if pong.wait(self.warn_after):
+                continue
+            where = self._on_loop_call or _describe_frame(
+                sys._current_frames().get(self._loop_thread_id)
+            )
+            while not pong.wait(interval):
+                if self._watchdog_stop.is_set():
+                    return
+            logger.warning(
+                "Event loop blocked for %.1f ms in %s",
+                (time.monotonic() - started) * 1000,
+                where,
+            )
+
+    def shutdown(self) -> None:
+        self._watchdog_stop.set()
+        self._pool.shutdown(wait=True)
@@ -1,21 +1,56 @@
+import asyncio
+import heapq
 import logging
 import os
 import re
+import time
 from contextlib import suppress
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from typing import Optional
 
 from telethon.errors import FileMigrateError, FileReferenceExpiredError
 from telethon.tl import types
 
+from telegram_logger.entity_cache import EntityCache
+from telegram_logger.health.metrics import MEDIA_DOWNLOAD_BYTES, MEDIA_DOWNLOAD_SECONDS
+from telegram_logger.storage.base import BufferedFile, PurgeResult
+from telegram_logger.storage.executor import StorageExecutor
+
 logger = logging.getLogger(__name__)
 
+PURGE_BATCH_SIZE = 256
+EVICTION_LOW_WATERMARK = 0.9
+BLOB_DIR = ".blobs"
+# "{buffered_at}\t{path relative to media_dir}" lines for blob links; links share
+# one inode and so one mtime, this keeps each link's own buffering time across restarts
+LINK_TIMES = ".link_times"
+
 
 def canonical_prefix(msg_id: int, chat_id: int) -> str:
     return f"{chat_id}_{msg_id}_"
 
 
+def _is_chat_dir(name: str) -> bool:
+    return name.lstrip("-").isdigit()
+
+
+def shard_dir(base_dir: str, chat_id: int) -> str:
+    return os.path.join(base_dir, str(chat_id))
+
+
+def buffer_path(base_dir: str, msg_id: int, chat_id: int, name: str) -> str:
+    return os.path.join(shard_dir(base_dir, chat_id), f"{msg_id}_{name}")
+
+
 def find_by_prefix(base_dir: str, msg_id: int, chat_id: int) -> Optional[str]:
+    shard_prefix = f"{msg_id}_"
+    with suppress(FileNotFoundError):
+        for name in os.listdir(shard_dir(base_dir, chat_id)):
+            path = os.path.join(shard_dir(base_dir, chat_id), name)
+            if name.startswith(shard_prefix) and os.path.isfile(path):
+                return path
+
+    # flat layout: not yet migrated canonical files and legacy "{msg_id}_" files
     prefixes = (canonical_prefix(msg_id, chat_id), f"{msg_id}_")
     try:
         for name in os.listdir(base_dir):
@@ -27,6 +62,176 @@ def find_by_prefix(base_dir: str, msg_id: int, chat_id: int) -> Optional[str]:
     return None
 
 
+def parse_buffer_name(name: str) -> tuple[Optional[int], Optional[int]]:
+    """Return (chat_id, msg_id) for flat canonical names, (None, msg_id) for legacy ones."""
+    parts = name.split("_", 2)
+    if len(parts) == 3 and parts[0].lstrip("-").isdigit() and parts[1].isdigit():
+        return int(parts[0]), int(parts[1])
+    if len(parts) >= 2 and parts[0].isdigit():
+        return None, int(parts[0])
+    return None, None
+
+
+def parse_buffer_path(base_dir: str, path: str) -> tuple[Optional[int], Optional[int]]:
+    parent, name = os.path.split(path)
+    if os.path.dirname(parent) == os.fspath(base_dir).rstrip(os.sep) and _is_chat_dir(
+        os.path.basename(parent)
+    ):
+        msg_part = name.split("_", 1)[0]
+        if msg_part.isdigit():
+            return int(os.path.basename(parent)), int(msg_part)
+        return None, None
+    return parse_buffer_name(name)
+
+
+def _remove_quietly(path: str) -> None:
+    with suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def _remove_files(paths: list[str]) -> list[tuple[str, Exception]]:
+    failed = []
+    for path in paths:
+        try:
+            _remove_quietly(path)
+        except Exception as e:
+            failed.append((path, e))
+    return failed
+
+
+def _remove_empty_dirs(paths) -> None:
+    for path in paths:
+        with suppress(OSError):
+            os.rmdir(path)
+
+
+def _chat_shards(paths) -> list[str]:
+    """The chat shard directories holding paths, for _remove_empty_dirs()."""
+    dirs = {os.path.dirname(path) for path in paths}
+    return [d for d in dirs if _is_chat_dir(os.path.basename(d))]
+
+
+def media_key(media) -> Optional[str]:
+    """Stable id of the downloadable file behind media, shared across chats and forwards."""
+    photo = media if isinstance(media, types.Photo) else getattr(media, "photo", None)
+    if isinstance(photo, types.Photo):
+        return f"photo{photo.id}"
+    doc = media if isinstance(media, types.Document) else getattr(media, "document", None)
+    if isinstance(doc, types.Document):
+        return f"doc{doc.id}"
+    return None
+
+
+def _scan_blobs(blob_dir: str) -> dict[str, os.stat_result]:
+    """Return the blobs still linked from a message file, removing the others."""
+    blobs = {}
+    try:
+        entries = list(os.scandir(blob_dir))
+    except FileNotFoundError:
+        return blobs
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        try:
+            st = entry.stat()
+            if st.st_nlink > 1:
+                blobs[entry.path] = st
+            else:
+                os.remove(entry.path)
+        except OSError:
+            continue
+    return blobs
+
+
+def _read_link_times(log_path: str) -> dict[str, float]:
+    times = {}
+    try:
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                buffered_at, _, rel_path = line.rstrip("\n").partition("\t")
+                with suppress(ValueError):
+                    times[rel_path] = float(buffered_at)
+    except FileNotFoundError:
+        pass
+    return times
+
+
+def _write_link_times(log_path: str, times: dict[str, float]) -> None:
+    tmp = f"{log_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(f"{buffered_at:.3f}\t{rel}\n" for rel, buffered_at in times.items())
+    os.replace(tmp, log_path)
+
+
+def _append_link_time(log_path: str, rel_path: str, buffered_at: float) -> None:
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(f"{buffered_at:.3f}\t{rel_path}\n")
+
+
+def _link_blob(blob: str, path: str) -> Optional[os.stat_result]:
+    try:
+        os.link(blob, path)
+    except FileNotFoundError:
+        return None
+    except FileExistsError:
+        os.remove(path)
+        os.link(blob, path)
+    # no utime: links share one inode, so that would renew the TTL of every copy;
+    # the link's own buffering time goes to LINK_TIMES instead
+    return os.stat(path)
+
+
+def _publish_blob(path: str, blob: Optional[str]) -> tuple[os.stat_result, bool]:
+    published = False
+    if blob is not None:
+        try:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.link(path, blob)
+            published = True
+        except FileExistsError:
+            pass
+        except OSError as e:
+            logger.debug("Failed to link buffered file %s as blob %s: %s", path, blob, e)
+    return os.stat(path), published
+
+
+def _chat_type_key(message) -> str:
+    if getattr(message, "is_channel", False) and not getattr(message, "is_group", False):
+        return "channel"
+    if getattr(message, "is_group", False):
+        return "group"
+    return "user"
+
+
+def migrate_flat_layout(base_dir: str) -> int:
+    """Move flat "{chat_id}_{msg_id}_{name}" files into "{chat_id}/{msg_id}_{name}"."""
+    moved = 0
+    try:
+        entries = list(os.scandir(base_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if not entry.is_file():
+                continue
+        except OSError:
+            continue
+        chat_id, msg_id = parse_buffer_name(entry.name)
+        if chat_id is None:
+            continue
+        name = entry.name.split("_", 2)[2]
+        target = buffer_path(base_dir, msg_id, chat_id, name)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(entry.path, target)
+            moved += 1
+        except OSError as e:
+            logger.warning("Failed to migrate buffered file %s: %s", entry.path, e)
+    if moved:
+        logger.info("Migrated buffered media to sharded layout count=%s", moved)
+    return moved
+
+
 def _safe_name(name: str) -> str:
     safe = re.sub(r"[^\w\-. ()\[\]{}@,+=]", "_", name or "")
     return safe or "file.bin"
@@ -62,13 +267,229 @@ def _guess_filename_from_media(media) -> str:
 
 
 class PlaintextBufferStorage:
-    def __init__(self, client, media_dir: str, max_buffer_size: int):
+    def __init__(
+        self,
+        client,
+        media_dir: str,
+        max_buffer_size: int,
+        entity_cache: EntityCache | None = None,
+        purge_time_budget: float = 2.0,
+        io: StorageExecutor | None = None,
+        max_total_size: int = 0,
+        eviction_weights: dict[str, float] | None = None,
+        dedupe: bool = True,
+    ):
         self.client = client
+        self.entities = entity_cache or EntityCache(client)
+        self.io = io or StorageExecutor()
         self.media_dir = media_dir
         self.max_buffer_size = max_buffer_size
+        # (chat_id, msg_id) -> file; legacy "{msg_id}_" files are keyed by msg_id only
+        self._index: dict[tuple[int, int], BufferedFile] = {}
+        self._legacy_index: dict[int, BufferedFile] = {}
+        self._files: dict[str, BufferedFile] = {}
+        # (mtime, path) min-heap; entries of removed files are skipped lazily
+        self._expiry: list[tuple[float, str]] = []
+        self._indexed = False
+        self._bytes = 0
+        self.purge_time_budget = purge_time_budget
+        self.purged_files = 0
+        self.purged_bytes = 0
+        self.purge_backlog = False
+        # 0 disables the quota; eviction brings usage down to EVICTION_LOW_WATERMARK
+        self.max_total_size = max_total_size
+        self.eviction_weights = eviction_weights or {}
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        # one hardlinked copy per Telegram file id under media/.blobs; bytes are
+        # counted once per inode and a blob is removed with its last message file
+        self.dedupe = dedupe
+        self.blob_dir = os.path.join(media_dir, BLOB_DIR)
+        self._link_times_path = os.path.join(self.blob_dir, LINK_TIMES)
+        self._blobs: dict[str, int] = {}
+        self._blob_inodes: dict[int, str] = {}
+        self._inode_refs: dict[int, int] = {}
+        self._orphan_blobs: list[str] = []
+        self._blob_downloads: dict[str, asyncio.Task] = {}
+        self.deduped_files = 0
+        self.deduped_bytes = 0
+        self.coalesced_downloads = 0
+
+    def _scan_index(self, link_times: dict[str, float]):
+        index: dict[tuple[int, int], BufferedFile] = {}
+        legacy: dict[int, BufferedFile] = {}
+        try:
+            entries = list(os.scandir(self.media_dir))
+        except FileNotFoundError:
+            return index, legacy
+        for entry in entries:
+            try:
+                if entry.is_dir() and _is_chat_dir(entry.name):
+                    with os.scandir(entry.path) as shard:
+                        for item in shard:
+                            self._scan_entry(item, index, legacy, link_times)
+                else:
+                    self._scan_entry(entry, index, legacy, link_times)
+            except OSError:
+                continue
+        return index, legacy
+
+    def _scan_entry(self, entry, index, legacy, link_times) -> None:
+        try:
+            if not entry.is_file():
+                return
+            st = entry.stat()
+        except OSError:
+            return
+        chat_id, msg_id = parse_buffer_path(self.media_dir, entry.path)
+        if msg_id is None:
+            return
+        buffered_at = st.st_mtime
+        if st.st_nlink > 1:
+            buffered_at = link_times.get(self._relpath(entry.path), buffered_at)
+        item = BufferedFile(entry.path, st.st_size, buffered_at, inode=st.st_ino)
+        if chat_id is None:
+            legacy.setdefault(msg_id, item)
+        else:
+            index.setdefault((chat_id, msg_id), item)
+
+    def _relpath(self, path: str) -> str:
+        return os.path.relpath(path, self.media_dir)
+
+    def _migrate_and_scan(self):
+        migrate_flat_layout(self.media_dir)
+        blobs = _scan_blobs(self.blob_dir) if self.dedupe else {}
+        link_times = _read_link_times(self._link_times_path) if self.dedupe else {}
+        index, legacy = self._scan_index(link_times)
+        if link_times:
+            # compact: keep the lines of links that still exist
+            live = {self._relpath(item.path) for item in index.values()}
+            _write_link_times(
+                self._link_times_path,
+                {rel: t for rel, t in link_times.items() if rel in live},
+            )
+        return index, legacy, blobs
+
+    async def rebuild_index(self) -> None:
+        index, legacy, blobs = await self.io.run(self._migrate_and_scan)
+        self._index, self._legacy_index = index, legacy
+        self._files = {
+            item.path: item for item in (*index.values(), *legacy.values())
+        }
+        self._blobs = {os.path.basename(path): st.st_ino for path, st in blobs.items()}
+        self._blob_inodes = {inode: key for key, inode in self._blobs.items()}
+        self._inode_refs = {}
+        self._bytes = sum(item.size for item in self._files.values() if self._retain(item))
+        self._expiry = [(item.mtime, path) for path, item in self._files.items()]
+        heapq.heapify(self._expiry)
+        self._indexed = True
+        logger.info(
+            "Media buffer index rebuilt files=%s legacy_files=%s",
+            len(index),
+            len(legacy),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "bytes": self._bytes,
+            "purged_files": self.purged_files,
+            "purged_bytes": self.purged_bytes,
+            "purge_backlog": self.purge_backlog,
+            "quota_bytes": self.max_total_size,
+            "evicted_files": self.evicted_files,
+            "evicted_bytes": self.evicted_bytes,
+            "blobs": len(self._blobs),
+            "deduped_files": self.deduped_files,
+            "deduped_bytes": self.deduped_bytes,
+            "coalesced_downloads": self.coalesced_downloads,
+        }
+
+    def _weight(self, reason: str, chat_type: str) -> float:
+        weights = self.eviction_weights
+        return max(weights.get(reason, 1.0) * weights.get(chat_type, 1.0), 1e-6)
+
+    def _retain(self, item: BufferedFile) -> bool:
+        """Count a reference to the file's inode; True for the first one."""
+        if not item.inode:
+            return True
+        refs = self._inode_refs.get(item.inode, 0)
+        self._inode_refs[item.inode] = refs + 1
+        return refs == 0
+
+    def _release(self, item: BufferedFile) -> bool:
+        """Drop a reference to the file's inode; True when it was the last one."""
+        if not item.inode:
+            return True
+        refs = self._inode_refs.get(item.inode, 0) - 1
+        if refs > 0:
+            self._inode_refs[item.inode] = refs
+            return False
+        self._inode_refs.pop(item.inode, None)
+        key = self._blob_inodes.pop(item.inode, None)
+        if key is not None:
+            self._blobs.pop(key, None)
+            self._orphan_blobs.append(os.path.join(self.blob_dir, key))
+        return True
+
+    async def _remove_orphan_blobs(self) -> None:
+        if not self._orphan_blobs:
+            return
+        orphans, self._orphan_blobs = self._orphan_blobs, []
+        for path, e in await self.io.run(_remove_files, orphans):
+            logger.warning("Failed to remove media blob %s: %s", path, e)
+
+    def _index_add(self, chat_id: int, msg_id: int, item: BufferedFile) -> None:
+        path = item.path
+        previous = self._index.get((chat_id, msg_id))
+        if previous is not None:
+            self._index_discard(previous.path)
+        self._index[(chat_id, msg_id)] = item
+        self._files[path] = item
+        if self._retain(item):
+            self._bytes += item.size
+        heapq.heappush(self._expiry, (item.mtime, path))
+
+    def _index_discard(self, path: str) -> int:
+        """Forget a file, returning the bytes this frees (0 if other links remain)."""
+        freed = 0
+        item = self._files.pop(path, None)
+        if item is not None and self._release(item):
+            freed = item.size
+            self._bytes -= freed
+        if len(self._expiry) > 2 * len(self._files) + 1024:
+            self._expiry = [(f.mtime, p) for p, f in self._files.items()]
+            heapq.heapify(self._expiry)
+        chat_id, msg_id = parse_buffer_path(self.media_dir, path)
+        if msg_id is None:
+            return freed
+        if chat_id is None:
+            item = self._legacy_index.get(msg_id)
+            if item is not None and item.path == path:
+                del self._legacy_index[msg_id]
+            return freed
+        item = self._index.get((chat_id, msg_id))
+        if item is not None and item.path == path:
+            del self._index[(chat_id, msg_id)]
+        return freed
+
+    def _lookup(self, msg_id: int, chat_id: int) -> Optional[str]:
+        if not self._indexed:
+            with self.io.on_loop("find_by_prefix"):
+                return find_by_prefix(self.media_dir, msg_id, chat_id)
+        item = self._index.get((chat_id, msg_id)) or self._legacy_index.get(msg_id)
+        return item.path if item else None
+
+    async def buffer_remove(self, path: str) -> None:
+        if not path:
+            return
+        self._index_discard(path)
+        await self.io.run(_remove_quietly, path)
+        await self._remove_orphan_blobs()
+        await self.io.run(_remove_empty_dirs, _chat_shards([path]))
 
     def buffer_find(self, msg_id: int, chat_id: int) -> Optional[str]:
-        found = find_by_prefix(self.media_dir, msg_id, chat_id)
+        found = self._lookup(msg_id, chat_id)
         if found:
             logger.debug(
                 "Found buffered media msg_id=%s chat_id=%s path=%s",
@@ -79,24 +500,7 @@ class PlaintextBufferStorage:
         return found
 
     async def _friendly_name(self, chat_id: int, base_file_name: str) -> str:
-        try:
-            entity = await self.client.get_entity(chat_id)
-            chat_name = (
-                getattr(entity, "username", None)
-                or getattr(entity, "title", None)
-                or "_".join(
-                    filter(
-                        None,
-                        [
-                            getattr(entity, "first_name", None),
-                            getattr(entity, "last_name", None),
-                        ],
-                    )
-                )
-                or str(chat_id)
-            )
-        except Exception:
-            chat_name = str(chat_id)
+        chat_name = await self.entities.chat_name(chat_id)
         return f"{_safe_name(chat_name)}_{_safe_name(base_file_name)}"
 
     async def _refresh_media_reference(self, message):
@@ -123,12 +527,48 @@ class PlaintextBufferStorage:
             return None
         return refreshed_message.media or getattr(refreshed_message, "video_note", None)
 
-    async def buffer_save(self, message) -> Optional[str]:
+    async def _enforce_quota(self, keep: str) -> None:
+        if not self.max_total_size or self._bytes <= self.max_total_size:
+            return
+        target = int(self.max_total_size * EVICTION_LOW_WATERMARK)
+        now = time.time()
+        # oldest first, with age divided by weight so valuable files live longer
+        candidates = sorted(
+            (item for item in self._files.values() if item.path != keep),
+            key=lambda item: (now - item.mtime) / item.weight,
+            reverse=True,
+        )
+        # hardlinked files only free space with their last link, so discard as we go
+        victims: dict[str, int] = {}
+        for item in candidates:
+            if self._bytes <= target:
+                break
+            victims[item.path] = self._index_discard(item.path)
+        if not victims:
+            return
+
+        failed = await self.io.run(_remove_files, list(victims))
+        await self._remove_orphan_blobs()
+        for path, e in failed:
+            logger.warning("Failed to evict file %s: %s", path, e)
+            victims.pop(path, None)
+        await self.io.run(_remove_empty_dirs, _chat_shards(victims))
+        freed = sum(victims.values())
+        self.evicted_files += len(victims)
+        self.evicted_bytes += freed
+        logger.info(
+            "Evicted buffered media over quota files=%s bytes=%s usage=%s quota=%s",
+            len(victims),
+            freed,
+            self._bytes,
+            self.max_total_size,
+        )
+
+    async def buffer_save(self, message, reason: str = "bulk") -> Optional[str]:
         media = message.media or getattr(message, "video_note", None)
         if not media:
             return None
 
-        os.makedirs(self.media_dir, exist_ok=True)
         try:
             size = getattr(getattr(message, "file", None), "size", None)
         except Exception:
@@ -144,7 +584,7 @@ class PlaintextBufferStorage:
             return None
 
         chat_id = message.chat_id or 0
-        if self.buffer_find(message.id, chat_id):
+        if self._lookup(message.id, chat_id):
             logger.debug(
                 "Skipping buffering because media already exists msg_id=%s chat_id=%s",
                 message.id,
@@ -154,13 +594,96 @@ class PlaintextBufferStorage:
 
         original_name = _guess_filename_from_media(media)
         human_name = await self._friendly_name(chat_id, original_name)
-        path = os.path.join(
-            self.media_dir, f"{canonical_prefix(message.id, chat_id)}{human_name}"
+        path = buffer_path(self.media_dir, message.id, chat_id, human_name)
+        await self.io.run(os.makedirs, os.path.dirname(path), exist_ok=True)
+        weight = self._weight(reason, _chat_type_key(message))
+
+        key = media_key(media) if self.dedupe else None
+        if key is not None:
+            pending = self._blob_downloads.get(key)
+            if pending is not None:
+                self.coalesced_downloads += 1
+                # returns when the download ends, whatever happened to its requester
+                await asyncio.wait([pending])
+            if key in self._blobs and await self._save_linked(
+                key, path, chat_id, message.id, weight
+            ):
+                return path
+            if key not in self._blob_downloads:
+                # its own task, so cancelling the first requester does not cancel the
+                # download for the requests coalesced onto it
+                download = asyncio.create_task(
+                    self._shared_download(key, message, media, path, weight),
+                    name=f"media-blob-{key}",
+                )
+                self._blob_downloads[key] = download
+                return await asyncio.shield(download)
+        return await self._download(message, media, path, weight, key)
+
+    async def _shared_download(
+        self, key: str, message, media, path: str, weight: float
+    ) -> Optional[str]:
+        try:
+            return await self._download(message, media, path, weight, key)
+        finally:
+            if self._blob_downloads.get(key) is asyncio.current_task():
+                del self._blob_downloads[key]
+
+    async def _save_linked(
+        self, key: str, path: str, chat_id: int, msg_id: int, weight: float
+    ) -> bool:
+        blob = os.path.join(self.blob_dir, key)
+        try:
+            st = await self.io.run(_link_blob, blob, path)
+        except OSError as e:
+            logger.warning("Failed to link media blob %s to %s: %s", blob, path, e)
+            return False
+        if st is None:
+            inode = self._blobs.pop(key, None)
+            self._blob_inodes.pop(inode, None)
+            return False
+        buffered_at = time.time()
+        try:
+            await self.io.run(
+                _append_link_time, self._link_times_path, self._relpath(path), buffered_at
+            )
+        except OSError as e:
+            logger.warning("Failed to record link time of %s: %s", path, e)
+        self._index_add(
+            chat_id, msg_id, BufferedFile(path, st.st_size, buffered_at, weight, st.st_ino)
+        )
+        self.deduped_files += 1
+        self.deduped_bytes += st.st_size
+        logger.debug(
+            "Linked buffered media to existing blob msg_id=%s chat_id=%s blob=%s",
+            msg_id,
+            chat_id,
+            key,
         )
+        await self._enforce_quota(keep=path)
+        return True
 
+    async def _download(
+        self, message, media, path: str, weight: float, key: Optional[str]
+    ) -> Optional[str]:
+        chat_id = message.chat_id or 0
         for attempt in (1, 2):
             try:
+                started = time.monotonic()
                 await self.client.download_media(media, path)
+                MEDIA_DOWNLOAD_SECONDS.observe(time.monotonic() - started)
+                blob = os.path.join(self.blob_dir, key) if key is not None else None
+                st, published = await self.io.run(_publish_blob, path, blob)
+                MEDIA_DOWNLOAD_BYTES.observe(st.st_size)
+                if published:
+                    self._blobs[key] = st.st_ino
+                    self._blob_inodes[st.st_ino] = key
+                self._index_add(
+                    chat_id,
+                    message.id,
+                    BufferedFile(path, st.st_size, st.st_mtime, weight, st.st_ino),
+                )
+                await self._enforce_quota(keep=path)
                 return path
             except (FileMigrateError, FileReferenceExpiredError) as e:
                 logger.warning(
@@ -170,8 +693,7 @@ class PlaintextBufferStorage:
                     attempt,
                     e,
                 )
-                with suppress(FileNotFoundError):
-                    os.remove(path)
+                await self.io.run(_remove_quietly, path)
                 if isinstance(e, FileReferenceExpiredError):
                     refreshed_media = await self._refresh_media_reference(message)
                     if refreshed_media:
@@ -190,30 +712,62 @@ class PlaintextBufferStorage:
                     chat_id,
                     e,
                 )
-                with suppress(FileNotFoundError):
-                    os.remove(path)
+                await self.io.run(_remove_quietly, path)
                 return None
 
         return None
 
-    async def purge_buffer_ttl(self, now: datetime, ttl_hours: int = 6) -> None:
-        ttl = timedelta(hours=ttl_hours)
-        if not os.path.isdir(self.media_dir):
-            return
-        purged = 0
-        for name in os.listdir(self.media_dir):
-            path = os.path.join(self.media_dir, name)
-            if not os.path.isfile(path):
+    async def purge_buffer_ttl(self, now: datetime, ttl_hours: int = 6) -> PurgeResult:
+        if not self._indexed:
+            await self.rebuild_index()
+        cutoff = (now - timedelta(hours=ttl_hours)).timestamp()
+        deadline = time.monotonic() + self.purge_time_budget
+        result = PurgeResult()
+        purged: list[str] = []
+
+        while self._expiry and self._expiry[0][0] < cutoff:
+            if result.files and time.monotonic() >= deadline:
+                result.complete = False
+                break
+            batch: list[tuple[BufferedFile, int]] = []
+            while (
+                self._expiry
+                and self._expiry[0][0] < cutoff
+                and len(batch) < PURGE_BATCH_SIZE
+            ):
+                mtime, path = heapq.heappop(self._expiry)
+                item = self._files.get(path)
+                if item is None or item.mtime != mtime:
+                    continue
+                batch.append((item, self._index_discard(path)))
+            if not batch:
                 continue
-            try:
-                mtime = os.path.getmtime(path)
-                if datetime.fromtimestamp(mtime, tz=timezone.utc) < (now - ttl):
-                    os.remove(path)
-                    purged += 1
-            except Exception as e:
+
+            failed = await self.io.run(_remove_files, [item.path for item, _ in batch])
+            await self._remove_orphan_blobs()
+            for path, e in failed:
                 logger.warning("Failed to purge file %s: %s", path, e)
-                continue
-        if purged > 0:
-            logger.info("Purged buffered media files count=%s", purged)
+            failed_paths = {path for path, _ in failed}
+            for item, freed in batch:
+                if item.path in failed_paths:
+                    continue
+                result.files += 1
+                result.bytes += freed
+                purged.append(item.path)
+
+        if purged:
+            await self.io.run(_remove_empty_dirs, _chat_shards(purged))
+
+        self.purged_files += result.files
+        self.purged_bytes += result.bytes
+        self.purge_backlog = not result.complete
+        if result.files > 0:
+            logger.info(
+                "Purged buffered media files count=%s bytes=%s complete=%s",
+                result.files,
+                result.bytes,
+                result.complete,
+            )
         else:
             logger.debug("No buffered media files expired for purge")
+        return result
@@ -7,3 +7,21 @@ class ChatType(Enum):
     GROUP = 3
     BOT = 4
     UNKNOWN = 0
+
+
+class PeerKind(Enum):
+    USER = 1
+    CHAT = 2
+    CHANNEL = 3
+
+
+# marked ids: users are positive, basic groups -id, channels -(10**12 + id)
+CHANNEL_ID_OFFSET = 1_000_000_000_000
+
+
+def peer_kind_for(chat_id: int) -> PeerKind:
+    if chat_id >= 0:
+        return PeerKind.USER
+    if chat_id > -CHANNEL_ID_OFFSET:
+        return PeerKind.CHAT
+    return PeerKind.CHANNEL
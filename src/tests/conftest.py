@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# settings and the database engine are created on import, so configure them first
+_data_root = tempfile.mkdtemp(prefix="telegram-logger-tests-")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("LOG_CHAT_ID", "1")
+os.environ.setdefault("DATA_ROOT", _data_root)
+os.makedirs(os.path.join(os.environ["DATA_ROOT"], "db"), exist_ok=True)
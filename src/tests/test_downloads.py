@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram_logger.storage.downloads import DownloadPriority, DownloadScheduler
+
+
+class _Storage:
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.order = []
+
+    async def buffer_save(self, message, reason):
+        self.order.append(message.id)
+        if message.id in self.fail_ids:
+            raise OSError("download failed")
+        return f"/buffer/{message.id}"
+
+
+def _message(msg_id):
+    return SimpleNamespace(chat_id=1, id=msg_id)
+
+
+def test_waiting_on_a_bulk_job_moves_it_ahead():
+    async def main():
+        storage = _Storage()
+        scheduler = DownloadScheduler(storage, workers=1)
+        for msg_id in range(1, 6):
+            scheduler.submit(_message(msg_id), DownloadPriority.BULK)
+        scheduler.submit(_message(6), DownloadPriority.NOFORWARDS)
+        waiter = asyncio.create_task(scheduler.wait_for(1, 5))
+        await asyncio.sleep(0)
+        scheduler.start()
+        assert await waiter == "/buffer/5"
+        assert storage.order[0] == 5
+        assert scheduler.stats()["expedited"] == 1
+        await scheduler.close()
+
+    asyncio.run(main())
+
+
+def test_failed_downloads_are_not_counted_as_completed():
+    async def main():
+        scheduler = DownloadScheduler(_Storage(fail_ids={2}), workers=1)
+        futures = [
+            scheduler.submit(_message(msg_id), DownloadPriority.BULK) for msg_id in (1, 2)
+        ]
+        scheduler.start()
+        assert await asyncio.gather(*futures) == ["/buffer/1", None]
+        stats = scheduler.stats()
+        assert (stats["completed"], stats["failed"]) == (1, 1)
+        await scheduler.close()
+
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+from telethon.tl import types
+
+from telegram_logger.database import media_codec
+
+
+def _media():
+    return types.MessageMediaDocument(
+        document=types.Document(
+            id=1,
+            access_hash=2,
+            file_reference=b"ref",
+            date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            mime_type="video/mp4",
+            size=1234,
+            dc_id=2,
+            attributes=[types.DocumentAttributeFilename("clip.mp4")],
+        )
+    )
+
+
+def test_blob_records_layer_and_round_trips():
+    blob = media_codec.encode_media(_media())
+    assert blob[0] in (media_codec.TAG_TL_LAYER, media_codec.TAG_TL_LAYER_ZSTD)
+    assert media_codec._LAYER.unpack_from(blob, 1)[0] == media_codec.LAYER
+    assert bytes(media_codec.decode_media(blob)) == bytes(_media())
+
+
+def test_blob_without_layer_still_decodes():
+    blob = bytes((media_codec.TAG_TL,)) + bytes(_media())
+    assert bytes(media_codec.decode_media(blob)) == bytes(_media())
+
+
+def test_blob_from_other_layer_that_no_longer_parses_is_unavailable():
+    header = bytes((media_codec.TAG_TL_LAYER,)) + media_codec._LAYER.pack(
+        media_codec.LAYER - 1
+    )
+    assert media_codec.decode_media(header + b"\x00\x01\x02\x03garbage") is None
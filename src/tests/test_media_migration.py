@@ -0,0 +1,41 @@
+import asyncio
+import pickle
+from datetime import datetime, timezone
+
+from telethon.tl import types
+
+from telegram_logger.database import MessageRepository
+from telegram_logger.database.media_codec import encode_media
+from telegram_logger.database.methods import get_media_batch
+from telegram_logger.settings import get_settings
+from telegram_logger.tg_types import ChatType
+
+
+def test_migrated_rows_are_not_read_again_after_restart():
+    media = types.MessageMediaGeo(geo=types.GeoPoint(long=1.0, lat=2.0, access_hash=3))
+
+    async def main():
+        db = MessageRepository(get_settings().build_sqlite_url())
+        await db.init()
+        for msg_id, blob in ((1, pickle.dumps(media)), (2, encode_media(media))):
+            await db.save_message(
+                id=msg_id,
+                from_id=1,
+                chat_id=30,
+                type=ChatType.USER.value,
+                msg_text="",
+                media=blob,
+                noforwards=False,
+                self_destructing=False,
+                created_at=datetime.now(timezone.utc),
+                edited_at=None,
+            )
+        assert len(await get_media_batch(0, 100)) == 1
+        assert await db.migrate_legacy_media() == 1
+
+        restarted = MessageRepository(get_settings().build_sqlite_url())
+        assert await get_media_batch(0, 100) == []
+        assert await restarted.migrate_legacy_media() == 0
+        assert restarted.media_migration_done
+
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telethon.tl import types
+
+from telegram_logger.storage.plaintext import PlaintextBufferStorage
+
+
+class _Client:
+    def __init__(self):
+        self.downloads = 0
+        self.release = None
+
+    async def download_media(self, media, path):
+        self.downloads += 1
+        if self.release is not None:
+            await self.release.wait()
+        with open(path, "wb") as f:
+            f.write(b"media bytes")
+        return path
+
+
+def _photo(photo_id=1):
+    return types.MessageMediaPhoto(
+        photo=types.Photo(
+            id=photo_id,
+            access_hash=2,
+            file_reference=b"ref",
+            date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            sizes=[],
+            dc_id=2,
+        )
+    )
+
+
+def _message(msg_id, chat_id=10, media=None):
+    return SimpleNamespace(id=msg_id, chat_id=chat_id, media=media or _photo(), file=None)
+
+
+def _storage(tmp_path, client=None):
+    return PlaintextBufferStorage(
+        client=client or _Client(), media_dir=str(tmp_path), max_buffer_size=10**6
+    )
+
+
+def test_linked_copies_expire_on_their_own_schedule(tmp_path):
+    async def main():
+        storage = _storage(tmp_path)
+        await storage.rebuild_index()
+        first = await storage.buffer_save(_message(1))
+        await asyncio.sleep(0.05)
+        second = await storage.buffer_save(_message(2))
+        assert os.stat(first).st_ino == os.stat(second).st_ino
+
+        second_at = storage._files[second].mtime
+        now = datetime.fromtimestamp(second_at - 0.01, timezone.utc) + timedelta(hours=6)
+
+        restarted = _storage(tmp_path)
+        await restarted.rebuild_index()
+        result = await restarted.purge_buffer_ttl(now, ttl_hours=6)
+        assert result.files == 1
+        assert not os.path.exists(first)
+        assert os.path.exists(second)
+
+    asyncio.run(main())
+
+
+def test_eviction_removes_emptied_chat_shards(tmp_path):
+    async def main():
+        storage = PlaintextBufferStorage(
+            client=_Client(), media_dir=str(tmp_path), max_buffer_size=10**6, max_total_size=15
+        )
+        await storage.rebuild_index()
+        first = await storage.buffer_save(_message(1, chat_id=10, media=_photo(1)))
+        await storage.buffer_save(_message(2, chat_id=20, media=_photo(2)))
+        assert storage.stats()["evicted_files"] == 1
+        assert not os.path.exists(os.path.dirname(first))
+        assert os.path.isdir(tmp_path / "20")
+
+    asyncio.run(main())
+
+
+def test_coalesced_download_survives_cancelled_first_requester(tmp_path):
+    async def main():
+        client = _Client()
+        client.release = asyncio.Event()
+        storage = _storage(tmp_path, client)
+        await storage.rebuild_index()
+        first = asyncio.create_task(storage.buffer_save(_message(1, chat_id=10)))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(storage.buffer_save(_message(2, chat_id=20)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        client.release.set()
+
+        path = await second
+        assert first.cancelled()
+        assert path is not None and os.path.exists(path)
+        assert client.downloads == 1
+        assert storage.stats()["coalesced_downloads"] == 1
+
+    asyncio.run(main())
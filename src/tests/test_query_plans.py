@@ -0,0 +1,13 @@
+import asyncio
+
+from telegram_logger.database.methods import check_query_plans
+from telegram_logger.database.models import register_models
+
+
+def test_hot_lookups_use_indexes():
+    async def main():
+        await register_models()
+        plans = await check_query_plans(strict=True)
+        assert all(plans.values())
+
+    asyncio.run(main())
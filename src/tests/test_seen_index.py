@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram_logger.database import MessageRepository, SeenMessageIndex
+from telegram_logger.settings import get_settings
+from telegram_logger.tg_types import ChatType
+
+
+def test_warm_sizes_bloom_filter_from_row_count():
+    async def main():
+        db = MessageRepository(
+            get_settings().build_sqlite_url(),
+            seen_index=SeenMessageIndex(expected_messages=2, recent_size=10),
+        )
+        await db.init()
+        for msg_id in range(1, 11):
+            await db.save_message(
+                id=msg_id,
+                from_id=1,
+                chat_id=20,
+                type=ChatType.USER.value,
+                msg_text="text",
+                media=None,
+                noforwards=False,
+                self_destructing=False,
+                created_at=datetime.now(timezone.utc),
+                edited_at=None,
+            )
+        await db.warm_seen_index()
+        stats = db.seen_index.stats()
+        assert stats["bloom_capacity"] >= 2 * stats["bloom_count"]
+        assert not db.seen_index.saturated
+        await db.close()
+
+    asyncio.run(main())
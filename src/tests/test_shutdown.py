@@ -0,0 +1,88 @@
+import asyncio
+import os
+import signal
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import OperationalError
+
+from telegram_logger.database import MessageRepository
+from telegram_logger.database import repository as repository_module
+from telegram_logger.main import install_shutdown_handlers
+from telegram_logger.settings import get_settings
+from telegram_logger.tg_types import ChatType
+
+
+def _row(msg_id: int) -> dict:
+    return dict(
+        id=msg_id,
+        from_id=1,
+        chat_id=10,
+        type=ChatType.USER.value,
+        msg_text=f"message {msg_id}",
+        media=None,
+        noforwards=False,
+        self_destructing=False,
+        created_at=datetime.now(timezone.utc),
+        edited_at=None,
+    )
+
+
+def test_sigterm_drains_write_behind_queue():
+    async def service(db: MessageRepository):
+        try:
+            await asyncio.sleep(60)
+        finally:
+            await db.close()
+
+    async def main():
+        db = MessageRepository(
+            get_settings().build_sqlite_url(), write_behind=True, flush_interval=60
+        )
+        await db.init()
+        for msg_id in range(1, 6):
+            await db.save_message(**_row(msg_id))
+        assert db.pending_count == 5
+
+        shutdown = install_shutdown_handlers(asyncio.current_task())
+        asyncio.get_running_loop().call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+        try:
+            await service(db)
+        except asyncio.CancelledError:
+            assert shutdown.is_set()
+        finally:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                asyncio.get_running_loop().remove_signal_handler(sig)
+
+        assert db.pending_count == 0
+        check = MessageRepository(get_settings().build_sqlite_url())
+        for msg_id in range(1, 6):
+            assert await check.message_exists(msg_id, 10)
+
+    asyncio.run(main())
+
+
+def test_full_queue_backs_off_after_failed_flush(monkeypatch):
+    calls = 0
+
+    async def locked(rows, table):
+        nonlocal calls
+        calls += 1
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(repository_module, "save_messages", locked)
+
+    async def main():
+        db = MessageRepository(
+            get_settings().build_sqlite_url(),
+            write_behind=True,
+            batch_size=2,
+            max_pending=2,
+            flush_interval=60,
+        )
+        for msg_id in range(100, 120):
+            await db.save_message(**_row(msg_id))
+        assert calls == 1
+        assert db.pending_count == 20
+        assert db.stats()["flush_failures"] == 1
+
+    asyncio.run(main())